@@ -1,86 +1,111 @@
-import tempfile
+import time
+_started = time.perf_counter()
+
 import streamlit as st
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.vectorstores.chroma import Chroma
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.output_parsers import StrOutputParser
-from langchain.prompts import ChatPromptTemplate
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 import os
-import requests
+import uuid
+import weakref
 from dotenv import load_dotenv
-import pandas as pd
-from docx import Document
+from groq_client import GroqClient
+from extraction import iter_pdf_pages, iter_docx_paragraphs, iter_excel_rows
+from ingest_cache import sha256_of
+# chromadb, langchain and python-docx are imported where they are used, so
+# the page renders before they are loaded
+
+# Seconds spent importing this module, shown in the sidebar
+STARTUP_IMPORT_SECONDS = time.perf_counter() - _started
 
 load_dotenv()
 
 # Load the Groq API key from the environment
 GROQ_API_KEY = os.getenv('GROQ_API_KEY')
 
-# Load the uploaded file
+# Indexed documents kept in memory for follow-up questions; the least
+# recently used one is dropped beyond this
+RAG_INDEX_CACHE_ENTRIES = int(os.getenv('RAG_INDEX_CACHE_ENTRIES', 8))
+
+# Render the answer token by token as it is generated (0 waits for the
+# whole answer)
+RAG_STREAM = os.getenv('RAG_STREAM', '1') == '1'
+
+# Load the uploaded file; Streamlit already holds it in memory, so it is
+# parsed from there instead of going through a temporary file
 def file_loader(uploaded_file):
     temp = None
+    uploaded_file.seek(0)
     if uploaded_file.name.endswith('.pdf'):
-        with tempfile.NamedTemporaryFile(delete=False) as temp_pdf:
-            temp_pdf.write(uploaded_file.read())
-            loader = PyPDFLoader(file_path=temp_pdf.name)
-            temp = loader.load()
-            os.remove(temp_pdf.name)
+        from langchain_core.documents import Document
+        temp = [
+            Document(page_content=text, metadata={'source': uploaded_file.name, 'page': page})
+            for page, text in enumerate(iter_pdf_pages(uploaded_file))
+        ]
     elif uploaded_file.name.endswith('.docx'):
-        with tempfile.NamedTemporaryFile(delete=False) as temp_docx:
-            temp_docx.write(uploaded_file.read())
-            temp_docx.seek(0)
-            doc = Document(temp_docx.name)
-            temp = [{'page_content': p.text} for p in doc.paragraphs if p.text.strip()]
-            os.remove(temp_docx.name)
+        temp = [{'page_content': text} for text in iter_docx_paragraphs(uploaded_file) if text.strip()]
     elif uploaded_file.name.endswith('.xlsx'):
-        with tempfile.NamedTemporaryFile(delete=False) as temp_excel:
-            temp_excel.write(uploaded_file.read())
-            temp_excel.seek(0)
-            df = pd.read_excel(temp_excel.name)
-            temp = [{'page_content': str(row)} for row in df.to_dict(orient='records')]
-            os.remove(temp_excel.name)
+        # Every sheet, one row at a time
+        temp = [{'page_content': str(row['values']), 'metadata': {'sheet': row['sheet'], 'row': row['row']}}
+                for row in iter_excel_rows(uploaded_file)]
     return temp
 
-# Groq API function to get embeddings
+# One Groq client per process, so its pooled connections survive reruns
+# and are shared by every session
+@st.cache_resource
+def groq_client():
+    return GroqClient(GROQ_API_KEY)
+
+# Groq API function to get embeddings (batched, one per text, in order)
 def get_embeddings(texts):
-    headers = {"Authorization": f"Bearer {GROQ_API_KEY}"}
-    response = requests.post("https://api.groq.com/embedding", json={"texts": texts}, headers=headers)
-    response.raise_for_status()
-    return response.json()
+    return groq_client().embed(texts)
 
 # Groq API function to generate text
 def generate_text(prompt):
-    headers = {"Authorization": f"Bearer {GROQ_API_KEY}"}
-    response = requests.post("https://api.groq.com/generate", json={"prompt": prompt}, headers=headers)
-    response.raise_for_status()
-    return response.json()['generated_text']
+    return groq_client().generate(prompt)
+
+# Groq API function to generate text as a stream of tokens; timings gets
+# the time to first token and the total generation time
+def generate_text_stream(prompt, timings=None):
+    return groq_client().generate_stream(prompt, timings)
 
 # Function to push vector data into Groq
 def push_vectors_to_groq(vectors):
-    headers = {"Authorization": f"Bearer {GROQ_API_KEY}"}
-    response = requests.post("https://api.groq.com/vectors", json={"vectors": vectors}, headers=headers)
-    response.raise_for_status()
+    groq_client().push_vectors(vectors)
 
-# RAG chain for sending the loaded document into the LLM for generating the response
-def RAG_chain(document, query):
+# Split, embed and store a document, once per distinct file content: the
+# result is shared by all sessions of this process and keyed on the
+# content hash, so follow-up questions about the same file go straight to
+# retrieval. (Arguments starting with _ are not part of the cache key.)
+@st.cache_resource(max_entries=RAG_INDEX_CACHE_ENTRIES, show_spinner="Indexing document...")
+def build_document_index(sha256, _uploaded_file):
+    import chromadb
+    from langchain_community.vectorstores.chroma import Chroma
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    document = file_loader(_uploaded_file)
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    if isinstance(document, list):  # for DOCX
+    if isinstance(document, list):  # for DOCX and Excel
         documents = [{'page_content': text} for text in document]
-    elif isinstance(document, pd.DataFrame):  # for Excel
-        documents = [{'page_content': str(row)} for row in document]
     else:  # for PDF
         documents = document
 
     splits = text_splitter.split_documents(documents=documents)
 
-    # Generate embeddings and store in Chroma
+    # Generate embeddings and store them in an in-memory Chroma collection
+    # of their own. In-memory clients share one store per process, so the
+    # collection is deleted once the cache has dropped this index and no
+    # session holds it any more.
     embeddings = get_embeddings([doc['page_content'] for doc in splits])
-    vectorstore = Chroma.from_embeddings(embeddings, splits, persist_directory='PDF-Chatbot/db')
-    
+    client = chromadb.EphemeralClient()
+    collection_name = f'doc_{sha256[:24]}_{uuid.uuid4().hex[:8]}'
+    vectorstore = Chroma.from_embeddings(embeddings, splits, client=client, collection_name=collection_name)
+    weakref.finalize(vectorstore, client.delete_collection, collection_name)
+
     # Push vector data into Groq
     push_vectors_to_groq(embeddings)
 
+    return vectorstore
+
+# Prompt for the LLM: the retrieved context and the user query
+def RAG_prompt(vectorstore, query):
+    from langchain.prompts import ChatPromptTemplate
     retriever = vectorstore.as_retriever()
 
     template = """
@@ -91,27 +116,42 @@ def RAG_chain(document, query):
 
     # LLM response generation
     context = retriever.retrieve(query)
-    input_text = prompt.format(context=context, question=query)
-    response = generate_text(input_text)
+    return prompt.format(context=context, question=query)
+
+# RAG chain for sending the indexed document into the LLM for generating the response
+def RAG_chain(vectorstore, query):
+    return generate_text(RAG_prompt(vectorstore, query))
 
-    return response
+# Same, yielding the response token by token
+def RAG_chain_stream(vectorstore, query, timings=None):
+    return generate_text_stream(RAG_prompt(vectorstore, query), timings)
 
-def PDFChatbot(uploaded_file, query):
-    document = file_loader(uploaded_file)
-    return RAG_chain(document=document, query=query)
+def PDFChatbot(uploaded_file, query, stream=False, timings=None):
+    vectorstore = build_document_index(sha256_of(uploaded_file), uploaded_file)
+    if stream:
+        return RAG_chain_stream(vectorstore=vectorstore, query=query, timings=timings)
+    return RAG_chain(vectorstore=vectorstore, query=query)
 
 # Main function of the program comprises of basic UI for user interaction
 if __name__ == '__main__':
     try:
         st.title("Chatbot 📚")
+        st.sidebar.caption(f"Startup imports: {STARTUP_IMPORT_SECONDS:.2f}s")
         uploaded_file = st.file_uploader('Upload PDF, DOCX, or Excel file', type=['pdf', 'docx', 'xlsx'])
         prompt = st.text_input('Enter the question you want to ask to the LLM', placeholder='Enter your prompt here...')
         
         if st.button("Submit"):
             if uploaded_file and prompt:
-                result = PDFChatbot(uploaded_file=uploaded_file, query=prompt)
+                if RAG_STREAM:
+                    timings = {}
+                    st.write_stream(PDFChatbot(uploaded_file=uploaded_file, query=prompt, stream=True, timings=timings))
+                    if timings.get('first_token_seconds') is not None:
+                        st.caption(f"First token {timings['first_token_seconds']:.2f}s, "
+                                   f"answer {timings['total_seconds']:.2f}s ({timings['tokens']} tokens)")
+                else:
+                    result = PDFChatbot(uploaded_file=uploaded_file, query=prompt)
+                    st.write(result)
                 st.balloons()
-                st.write(result)
             else:
                 st.warning("Please upload a file and enter a question!")
     except Exception as e:
@@ -0,0 +1,183 @@
+# In-process approximate nearest-neighbour index (IVF over count sketches,
+# exact rerank) for sparse TF-IDF vectors, snapshotted to a local .npz
+import os
+import threading
+import time
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+
+ANN_DIM = int(os.getenv('ANN_DIM', 256))
+ANN_LISTS = int(os.getenv('ANN_LISTS', 64))
+ANN_PROBES = int(os.getenv('ANN_PROBES', 8))
+ANN_RERANK = int(os.getenv('ANN_RERANK', 100))
+ANN_TRAIN_SAMPLE = 20_000
+ANN_KMEANS_ITERATIONS = 10
+
+
+def _sketch_buckets(indices, dim):
+    hashed = (np.asarray(indices, dtype=np.uint64) * np.uint64(2654435761)) & np.uint64(0xFFFFFFFF)
+    signs = np.where(hashed & np.uint64(1 << 31), -1.0, 1.0).astype(np.float32)
+    return (hashed % np.uint64(dim)).astype(np.int64), signs
+
+
+# {'dim', 'indices', 'values'} -> L2-normalized dense sketch of length dim
+def sketch(vector, dim=ANN_DIM):
+    buckets, signs = _sketch_buckets(vector['indices'], dim)
+    dense = np.zeros(dim, dtype=np.float32)
+    np.add.at(dense, buckets, signs * np.asarray(vector['values'], dtype=np.float32))
+    norm = np.linalg.norm(dense)
+    return dense / norm if norm > 0 else dense
+
+
+def _sparse_row(vector):
+    indices = np.asarray(vector['indices'], dtype=np.int32)
+    values = np.asarray(vector['values'], dtype=np.float64)
+    return csr_matrix((values, indices, np.array([0, len(indices)])), shape=(1, vector['dim']))
+
+
+# Spherical k-means: centroids are unit vectors, similarity is dot product
+def _kmeans(points, n_lists, iterations=ANN_KMEANS_ITERATIONS, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = points[rng.choice(len(points), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(points @ centroids.T, axis=1)
+        for i in range(n_lists):
+            members = points[assignments == i]
+            if len(members):
+                centroid = members.sum(axis=0)
+                norm = np.linalg.norm(centroid)
+                if norm > 0:
+                    centroids[i] = centroid / norm
+    return centroids
+
+
+# Exact search until there are enough documents to train the lists on
+class AnnIndex:
+    def __init__(self, dim=ANN_DIM, n_lists=ANN_LISTS):
+        self.dim = dim
+        self.n_lists = n_lists
+        self.lock = threading.Lock()
+        self.ids = []
+        self.positions = {}
+        self.dense = np.zeros((0, dim), dtype=np.float32)
+        self.rows = []
+        self.matrix = None
+        self.centroids = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.trained_on = 0
+        self.synced_at = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.positions
+
+    # Add a document, or replace it if the id is already indexed
+    def add(self, doc_id, vector):
+        dense = sketch(vector, self.dim)
+        row = _sparse_row(vector)
+        with self.lock:
+            position = self.positions.get(doc_id)
+            if position is None:
+                position = len(self.ids)
+                self.positions[doc_id] = position
+                self.ids.append(doc_id)
+                self.rows.append(row)
+                if position == len(self.dense):
+                    # Grow the sketch matrix and assignments geometrically
+                    capacity = max(1024, 2 * len(self.dense))
+                    self.dense = np.resize(self.dense, (capacity, self.dim))
+                    self.assignments = np.resize(self.assignments, capacity)
+            else:
+                self.rows[position] = row
+            self.dense[position] = dense
+            self.matrix = None
+            if self.centroids is not None:
+                self.assignments[position] = int(np.argmax(self.centroids @ dense))
+            # Train once there are enough documents, retrain when the corpus doubles
+            if len(self.ids) >= max(self.n_lists * 16, 2 * self.trained_on):
+                self._train()
+
+    def _train(self):
+        count = len(self.ids)
+        points = self.dense[:count]
+        sample = points
+        if count > ANN_TRAIN_SAMPLE:
+            sample = points[np.random.default_rng(0).choice(count, ANN_TRAIN_SAMPLE, replace=False)]
+        self.centroids = _kmeans(sample, self.n_lists)
+        self.assignments[:count] = np.argmax(points @ self.centroids.T, axis=1)
+        self.trained_on = count
+
+    # [(doc_id, score)] for the k most similar documents
+    def search(self, vector, k=5, probes=ANN_PROBES, rerank=ANN_RERANK):
+        query_dense = sketch(vector, self.dim)
+        query_row = _sparse_row(vector)
+        with self.lock:
+            count = len(self.ids)
+            if count == 0:
+                return []
+            if self.matrix is None:
+                self.matrix = vstack(self.rows, format='csr')
+            matrix, ids = self.matrix, list(self.ids)
+            if self.centroids is None:
+                candidates = np.arange(count)
+            else:
+                lists = np.argsort(-(self.centroids @ query_dense))[:probes]
+                candidates = np.flatnonzero(np.isin(self.assignments[:count], lists))
+                if len(candidates) > rerank:
+                    approximate = self.dense[candidates] @ query_dense
+                    candidates = candidates[np.argpartition(-approximate, rerank - 1)[:rerank]]
+        if query_row.shape[1] != matrix.shape[1] or len(candidates) == 0:
+            return []
+        scores = (matrix[candidates] @ query_row.T).toarray().ravel()
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[candidates[i]], float(scores[i])) for i in top if scores[i] > 0]
+
+    def save(self, path):
+        with self.lock:
+            count = len(self.ids)
+            matrix = vstack(self.rows, format='csr') if self.rows else csr_matrix((0, 1))
+            state = {
+                'ids': np.array(self.ids, dtype=str),
+                'dense': self.dense[:count],
+                'assignments': self.assignments[:count],
+                'indptr': matrix.indptr,
+                'indices': matrix.indices,
+                'values': matrix.data,
+                'sparse_dim': np.array(matrix.shape[1]),
+                'trained_on': np.array(self.trained_on),
+                'synced_at': np.array(self.synced_at if self.synced_at is not None else -1.0),
+            }
+            if self.centroids is not None:
+                state['centroids'] = self.centroids
+        tmp_path = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(tmp_path, **state)
+        os.replace(tmp_path, path)
+
+    # Restore a snapshot; returns False if there is none or it doesn't fit
+    def load(self, path):
+        if not os.path.exists(path):
+            return False
+        state = np.load(path, allow_pickle=False)
+        if state['dense'].shape[1] != self.dim or ('centroids' in state and len(state['centroids']) != self.n_lists):
+            return False
+        count = len(state['ids'])
+        matrix = csr_matrix((state['values'], state['indices'], state['indptr']), shape=(count, int(state['sparse_dim'])))
+        with self.lock:
+            self.ids = state['ids'].tolist()
+            self.positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+            self.dense = state['dense'].copy()
+            self.assignments = state['assignments'].copy()
+            self.rows = [matrix[i] for i in range(count)]
+            self.matrix = None
+            self.centroids = state['centroids'] if 'centroids' in state else None
+            self.trained_on = int(state['trained_on'])
+            synced_at = float(state['synced_at'])
+            self.synced_at = synced_at if synced_at >= 0 else None
+        return True
+
+    def mark_synced(self, synced_at=None):
+        self.synced_at = time.time() if synced_at is None else synced_at
@@ -1,12 +1,21 @@
 from flask import Flask, request, jsonify
-import pandas as pd
-from PyPDF2 import PdfReader
-import os
-from docx import Document
+from extraction import iter_pdf_pages, iter_docx_paragraphs, iter_txt_blocks, iter_excel_rows
+from uploads import open_upload, UploadRequest
+from streaming import stream_mode, numbered, upload_stream_response
 
 app = Flask(__name__)
-UPLOAD_FOLDER = "D:/Disruptive Ai/New folder"
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.request_class = UploadRequest  # uploads up to UPLOAD_SPILL_BYTES stay in memory
+
+# Records for the opt-in streaming mode (see streaming.py): one per page,
+# paragraph or text block, sent as soon as it is extracted
+def pdf_records(upload):
+    return numbered('page', iter_pdf_pages(upload))
+
+def docx_records(upload):
+    return numbered('paragraph', iter_docx_paragraphs(upload))
+
+def txt_records(upload):
+    return numbered('block', iter_txt_blocks(upload))
 
 @app.route('/upload/excel', methods=['POST'])
 def upload_excel():
@@ -16,10 +25,8 @@ def upload_excel():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     if file and file.filename.endswith('.xlsx'):
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(file_path)
-        df = pd.read_excel(file_path)
-        return jsonify(df.to_dict()), 200
+        # Every sheet, streamed back one row per NDJSON line
+        return upload_stream_response(file, iter_excel_rows, stream_mode() or 'ndjson'), 200
     return jsonify({'error': 'Invalid file format'}), 400
 
 @app.route('/upload/pdf', methods=['POST'])
@@ -30,13 +37,11 @@ def upload_pdf():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     if file and file.filename.endswith('.pdf'):
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(file_path)
-        with open(file_path, 'rb') as f:
-            reader = PdfReader(f)
-            text = ''
-            for page in reader.pages:
-                text += page.extract_text()
+        mode = stream_mode()
+        if mode:
+            return upload_stream_response(file, pdf_records, mode), 200
+        with open_upload(file) as upload:
+            text = ''.join(iter_pdf_pages(upload))
         return jsonify({'text': text}), 200
     return jsonify({'error': 'Invalid file format'}), 400
 
@@ -48,14 +53,15 @@ def upload_document():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     if file and (file.filename.endswith('.txt') or file.filename.endswith('.docx')):
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(file_path)
-        if file.filename.endswith('.txt'):
-            with open(file_path, 'r') as f:
-                text = f.read()
-        elif file.filename.endswith('.docx'):
-            doc = Document(file_path)
-            text = '\n'.join([para.text for para in doc.paragraphs])
+        mode = stream_mode()
+        if mode:
+            records = txt_records if file.filename.endswith('.txt') else docx_records
+            return upload_stream_response(file, records, mode), 200
+        with open_upload(file) as upload:
+            if file.filename.endswith('.txt'):
+                text = ''.join(iter_txt_blocks(upload))
+            elif file.filename.endswith('.docx'):
+                text = '\n'.join(iter_docx_paragraphs(upload))
         return jsonify({'text': text}), 200
     return jsonify({'error': 'Invalid file format'}), 400
 
@@ -66,27 +72,24 @@ def upload_all():
     file = request.files['file']
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-    file.save(file_path)
-
     if file.filename.endswith('.xlsx'):
-        df = pd.read_excel(file_path)
-        return jsonify({'data': df.to_dict()}), 200
-    elif file.filename.endswith('.pdf'):
-        with open(file_path, 'rb') as f:
-            reader = PdfReader(f)
-            text = ''
-            for page in reader.pages:
-                text += page.extract_text()
-        return jsonify({'text': text}), 200
-    elif file.filename.endswith('.txt'):
-        with open(file_path, 'r') as f:
-            text = f.read()
-        return jsonify({'text': text}), 200
-    elif file.filename.endswith('.docx'):
-        doc = Document(file_path)
-        text = '\n'.join([para.text for para in doc.paragraphs])
-        return jsonify({'text': text}), 200
+        return upload_stream_response(file, iter_excel_rows, stream_mode() or 'ndjson'), 200
+    mode = stream_mode()
+    if mode:
+        for extension, records in (('.pdf', pdf_records), ('.txt', txt_records), ('.docx', docx_records)):
+            if file.filename.endswith(extension):
+                return upload_stream_response(file, records, mode), 200
+        return jsonify({'error': 'Invalid file format'}), 400
+    with open_upload(file) as upload:
+        if file.filename.endswith('.pdf'):
+            text = ''.join(iter_pdf_pages(upload))
+            return jsonify({'text': text}), 200
+        elif file.filename.endswith('.txt'):
+            text = ''.join(iter_txt_blocks(upload))
+            return jsonify({'text': text}), 200
+        elif file.filename.endswith('.docx'):
+            text = '\n'.join(iter_docx_paragraphs(upload))
+            return jsonify({'text': text}), 200
 
     return jsonify({'error': 'Invalid file format'}), 400
 
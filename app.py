@@ -1,55 +1,271 @@
+# Created before the other imports so the startup report includes them
+from lazy_resources import StartupReport, LazyResource, resource_status, all_loaded, warm_up
+startup = StartupReport()
+
 import os
-import pandas as pd
-from flask import Flask, request, jsonify
-from PyPDF2 import PdfReader
-from docx import Document
-from sentence_transformers import SentenceTransformer
-import chromadb
+import json
+import time
+import numpy as np
+from flask import Flask, Response, request, jsonify, stream_with_context
+from extraction import iter_pdf_pages_parallel, iter_docx_paragraphs, iter_txt_blocks, iter_excel_blocks
+from uploads import open_upload, UploadRequest
+from data_dir import data_path
+from job_queue import JobQueue
+from batch_ingest import iter_batch_files, iter_extracted, iter_groups, batch_summary, skip_duplicates
+from ingest_cache import IngestCache, sha256_of
+from chunking import chunk_text, chunk_table_text, split_passages
+from embedding_batcher import EmbeddingBatcher
+from embedding_cache import EmbeddingCache
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from inference_backend import load_embedding_model, load_qa_pipeline, embedding_cache_name
 import logging
-from transformers import pipeline
 
-app = Flask(__name__)
-UPLOAD_FOLDER = r"D:\RAG-IMP\data"
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+startup.mark('imports')
 
-if not os.path.exists(app.config['UPLOAD_FOLDER']):
-    os.makedirs(app.config['UPLOAD_FOLDER'])
+app = Flask(__name__)
+app.request_class = UploadRequest  # uploads up to UPLOAD_SPILL_BYTES stay in memory
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
 
-# Initialize ChromaDB client with the new API
-chroma_client = chromadb.PersistentClient(path="chroma_persist")  # specify the directory for persistence
+# A single process uses the persistent store directly. Several worker
+# processes (serve.py) must not open it each, so they all go through one
+# Chroma server at CHROMA_HOST instead.
+CHROMA_HOST = os.getenv('CHROMA_HOST')
+CHROMA_PORT = int(os.getenv('CHROMA_PORT', 8000))
+CHROMA_PATH = os.getenv('CHROMA_PATH', data_path('chroma'))
+
+# chromadb is imported here, when the client is first used, so processes
+# that only import this module don't pay for it
+def connect_chroma():
+    import chromadb
+    if CHROMA_HOST:
+        return chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+    # Initialize ChromaDB client with the new API
+    return chromadb.PersistentClient(path=CHROMA_PATH)  # specify the directory for persistence
+
+def open_collection():
+    try:
+        return chroma_client.create_collection(name="document_vectors")
+    except Exception as e:
+        logging.error(f"Error creating collection: {e}")
+        # Retrieve the existing collection if it already exists
+        return chroma_client.get_collection(name="document_vectors")
+
+# Opened on first use, so a pre-fork server's workers each connect after the fork
+chroma_client = LazyResource('chroma_client', connect_chroma)
+collection = LazyResource('chroma_collection', open_collection)
 
-try:
-    collection = chroma_client.create_collection(name="document_vectors")
-except Exception as e:
-    logging.error(f"Error creating collection: {e}")
-    # Retrieve the existing collection if it already exists
-    collection = chroma_client.get_collection(name="document_vectors")
+# Content-hash cache of everything already ingested into the collection
+ingest_cache = IngestCache(namespace='rag')
 
-# Load the Hugging Face model for embeddings
+# Load the Hugging Face model for embeddings (torch or quantized ONNX, see
+# INFERENCE_BACKEND) on first use or on /warmup
 model_name = 'sentence-transformers/all-MiniLM-L6-v2'
-embedding_model = SentenceTransformer(model_name)
+embedding_model = LazyResource(
+    'embedding_model',
+    lambda: load_embedding_model(model_name),
+    warmup=lambda model: model.encode(['warm up'], batch_size=1)
+)
+
+# Chunks are sized to the model's input limit and encoded in batches
+EMBED_BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', 32))
+CHUNK_OVERLAP = int(os.getenv('CHUNK_OVERLAP', 32))
+# /upload/batch embeds and inserts at least this many chunks at a time
+BATCH_INSERT_CHUNKS = int(os.getenv('BATCH_INSERT_CHUNKS', 1024))
+
+# All handler threads encode through one micro-batching queue, behind a
+# persistent cache of every chunk and query embedded so far
+embedder = EmbeddingBatcher(embedding_model, max_batch_size=EMBED_BATCH_SIZE)
+embedding_cache = EmbeddingCache(embedding_cache_name(model_name), embedder.encode)
+
+# Chunks fill the model's input limit minus [CLS] and [SEP]
+def chunk_tokens():
+    return embedding_model.max_seq_length - 2
+
+# Candidates taken from each side before reciprocal-rank fusion
+RETRIEVE_CANDIDATES = int(os.getenv('RETRIEVE_CANDIDATES', 20))
+RETRIEVE_MODES = ('hybrid', 'dense', 'lexical')
+
+# Lexical BM25 index over the same chunks as the collection, built from the
+# collection on first use and updated on every insert
+def load_bm25_index(page_size=5000):
+    index = BM25Index()
+    offset = 0
+    while True:
+        page = collection.get(include=['documents'], limit=page_size, offset=offset)
+        if not page['ids']:
+            break
+        index.add_many(page['ids'], page['documents'])
+        offset += len(page['ids'])
+    logging.info(f"BM25 index loaded with {len(index)} chunks")
+    return index
+
+bm25_index = LazyResource('bm25_index', load_bm25_index)
+
+# With several worker processes, chunks inserted by another worker only
+# reach this one's BM25 index through the collection; check for them at
+# most every BM25_SYNC_SECONDS
+BM25_SYNC_SECONDS = float(os.getenv('BM25_SYNC_SECONDS', 5))
+bm25_synced = [0.0]
 
-# Initialize the QA pipeline
-qa_pipeline = pipeline("question-answering", model="distilbert-base-cased-distilled-squad")
+def sync_bm25_index():
+    now = time.monotonic()
+    if now - bm25_synced[0] < BM25_SYNC_SECONDS:
+        return
+    bm25_synced[0] = now
+    index = bm25_index.resource()
+    if collection.count() == len(index):
+        return
+    stored = collection.get(include=[])['ids']
+    present = set(stored)
+    index.remove_many([doc_id for doc_id in index.live_ids() if doc_id not in present])
+    known = set(index.live_ids())
+    missing = [doc_id for doc_id in stored if doc_id not in known]
+    for first in range(0, len(missing), 5000):
+        page = collection.get(ids=missing[first:first + 5000], include=['documents'])
+        index.add_many(page['ids'], page['documents'])
 
-def store_vector_in_chromadb(text, metadata):
+# Initialize the QA pipeline on first use or on /warmup
+qa_pipeline = LazyResource(
+    'qa_pipeline',
+    lambda: load_qa_pipeline("distilbert-base-cased-distilled-squad"),
+    warmup=lambda qa: qa(question="What is this?", context="This is a warm-up request.")
+)
+# QA only reads the retrieved passages closest to the query, as many as fit
+# in one model window next to the question, so its cost doesn't grow with
+# the size of the retrieved chunks
+QA_MAX_SEQ_LEN = int(os.getenv('QA_MAX_SEQ_LEN', 384))
+QA_PASSAGE_TOKENS = int(os.getenv('QA_PASSAGE_TOKENS', 64))
+QA_BATCH_SIZE = int(os.getenv('QA_BATCH_SIZE', 16))
+
+# Spreadsheets are chunked by whole rows, each chunk led by its sheet and
+# header lines; other text in overlapping token windows
+def chunk_document(filename, text):
+    if filename.endswith('.xlsx'):
+        return chunk_table_text(text, embedding_model.tokenizer, max_tokens=chunk_tokens())
+    return chunk_text(text, embedding_model.tokenizer, max_tokens=chunk_tokens(), overlap=CHUNK_OVERLAP)
+
+def store_chunks_in_chromadb(text, metadata, progress=None):
     try:
-        # Convert embedding to list
-        vector = embedding_model.encode(text).tolist()
-        logging.info(f"Attempting to store vector for {metadata['filename']}")
+        chunks = chunk_document(metadata['filename'], text)
+        texts = [chunk['text'] for chunk in chunks]
+        if progress is None:
+            vectors = embedding_cache.encode(texts)
+        else:
+            # Encode batch by batch so a background job can report how far it got
+            vectors = []
+            for first in range(0, len(texts), EMBED_BATCH_SIZE):
+                vectors.append(embedding_cache.encode(texts[first:first + EMBED_BATCH_SIZE]))
+                progress(chunks_embedded=min(first + EMBED_BATCH_SIZE, len(texts)), chunks_total=len(texts))
+            vectors = np.concatenate(vectors)
+        logging.info(f"Attempting to store {len(chunks)} chunks for {metadata['filename']}")
 
+        # One bulk insert per document
+        ids, metadatas = chunk_records(chunks, metadata)
+        add_to_collection(texts, vectors, ids, metadatas)
+        logging.info(f"Successfully stored {len(chunks)} chunks for {metadata['filename']}")
+        return vectors
+    except Exception as e:
+        logging.error(f"Error storing chunks in ChromaDB: {e}")
+        return None
+
+# Chunk ids are keyed on the content hash, not the filename: Chroma ignores
+# ids it already has, so a changed file re-uploaded under the same name
+# would otherwise keep its old chunks and never index the new ones
+def chunk_records(chunks, metadata):
+    ids = [f"{metadata['sha256']}#{i}" for i in range(len(chunks))]
+    metadatas = [
+        dict(metadata, chunk=i, start=chunk['start'], end=chunk['end'])
+        for i, chunk in enumerate(chunks)
+    ]
+    return ids, metadatas
+
+# Bulk insert, split only where it exceeds Chroma's batch limit
+def add_to_collection(documents, vectors, ids, metadatas):
+    max_batch = chroma_client.get_max_batch_size()
+    for first in range(0, len(ids), max_batch):
+        last = first + max_batch
         collection.add(
-            documents=[text],
-            embeddings=[vector],
-            ids=[metadata['filename']],
-            metadatas=[metadata]
+            documents=documents[first:last],
+            embeddings=vectors[first:last].tolist(),
+            ids=ids[first:last],
+            metadatas=metadatas[first:last]
         )
-        logging.info(f"Successfully stored vector for {metadata['filename']}")
-    except Exception as e:
-        logging.error(f"Error storing vector in ChromaDB: {e}")
+        bm25_index.add_many(ids[first:last], documents[first:last])
+
+# A filename stands for its latest content: once new content is stored (or
+# found in the cache) under filename, the older versions lose that name, and
+# a version no other filename refers to is removed from the collection and
+# the BM25 index
+def replace_previous_versions(filename, sha256):
+    for old_sha256 in ingest_cache.versions(filename):
+        if old_sha256 == sha256 or ingest_cache.remove_filename(old_sha256, filename):
+            continue
+        stale = collection.get(where={'sha256': old_sha256}, include=[])['ids']
+        if stale:
+            collection.delete(ids=stale)
+            bm25_index.remove_many(stale)
+            logging.info(f"Removed {len(stale)} chunks of the previous version of {filename}")
+
+# Embed and insert the chunks of several extracted files together
+def store_batch_in_chromadb(items):
+    texts, ids, metadatas = [], [], []
+    for item in items:
+        metadata = {'filename': item['filename'], 'file_type': item['filename'].split('.')[-1], 'sha256': item['sha256']}
+        item_ids, item_metadatas = chunk_records(item['chunks'], metadata)
+        texts.extend(chunk['text'] for chunk in item['chunks'])
+        ids.extend(item_ids)
+        metadatas.extend(item_metadatas)
+    vectors = embedding_cache.encode(texts)
+    add_to_collection(texts, vectors, ids, metadatas)
+    first = 0
+    for item in items:
+        last = first + len(item['chunks'])
+        ingest_cache.put(item['sha256'], item['filename'], item['text'], vectors[first:last])
+        replace_previous_versions(item['filename'], item['sha256'])
+        first = last
+
+def iter_upload_blocks(filename, upload):
+    if filename.endswith('.xlsx'):
+        return iter_excel_blocks(upload, index=False)
+    elif filename.endswith('.pdf'):
+        return iter_pdf_pages_parallel(upload)
+    elif filename.endswith('.txt'):
+        return iter_txt_blocks(upload)
+    elif filename.endswith('.docx'):
+        return iter_docx_paragraphs(upload)
+    return iter(())
+
+# Extract, chunk, embed and store one upload; returns (response body, status)
+def ingest_upload(filename, upload, sha256, progress=None):
+    blocks = []
+    for block in iter_upload_blocks(filename, upload):
+        blocks.append(block)
+        if progress is not None:
+            progress(pages_done=len(blocks))
+    text = ('\n' if filename.endswith('.docx') else '').join(blocks)
+
+    if text.strip():
+        metadata = {'filename': filename, 'file_type': filename.split('.')[-1], 'sha256': sha256}
+        vectors = store_chunks_in_chromadb(text, metadata, progress)
+        if vectors is None:
+            return {'error': 'Error storing vectors'}, 500
+        ingest_cache.put(sha256, filename, text, vectors)
+        replace_previous_versions(filename, sha256)
+        return {'message': 'Vectors stored successfully', 'chunks': len(vectors)}, 200
+    else:
+        return {'error': 'No text found in file'}, 400
+
+# Background ingestion: the payload was saved by /upload?async=1
+def run_ingest_job(job, progress):
+    with open(job['payload_path'], 'rb') as upload:
+        body, status = ingest_upload(job['filename'], upload, job['meta']['sha256'], progress)
+    if status != 200:
+        raise RuntimeError(body['error'])
+    return body
+
+ingest_jobs = JobQueue(run_ingest_job)
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -59,64 +275,252 @@ def upload_file():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
 
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-    file.save(file_path)
-    
-    text = ''
-    try:
-        if file.filename.endswith('.xlsx'):
-            df = pd.read_excel(file_path)
-            text = df.to_string(index=False)
-        elif file.filename.endswith('.pdf'):
-            with open(file_path, 'rb') as f:
-                reader = PdfReader(f)
-                for page in reader.pages:
-                    text += page.extract_text() or ''
-        elif file.filename.endswith('.txt'):
-            with open(file_path, 'r') as f:
-                text = f.read()
-        elif file.filename.endswith('.docx'):
-            doc = Document(file_path)
-            text = '\n'.join([para.text for para in doc.paragraphs])
-        
-        if text.strip():
-            metadata = {'filename': file.filename, 'file_type': file.filename.split('.')[-1]}
-            store_vector_in_chromadb(text, metadata)
-            return jsonify({'message': 'Vector stored successfully'}), 200
-        else:
-            return jsonify({'error': 'No text found in file'}), 400
-    finally:
-        os.remove(file_path)
+    # Identical content is only ingested once, whatever the filename
+    sha256 = sha256_of(file.stream)
+    cached = ingest_cache.get(sha256)
+    if cached is not None:
+        ingest_cache.add_filename(sha256, file.filename)
+        replace_previous_versions(file.filename, sha256)
+        return jsonify({'message': 'Vector already stored', 'duplicate_of': cached['filenames']}), 200
+
+    # Async mode: store the payload, queue the work and answer straight away.
+    # The workers start with the first job in processes that did not start
+    # them up front (flask run, other WSGI servers).
+    if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+        ingest_jobs.start()
+        job_id = ingest_jobs.enqueue(file.filename, file.stream, meta={'sha256': sha256})
+        return jsonify({'job_id': job_id, 'status_url': f'/jobs/{job_id}'}), 202
+
+    with open_upload(file) as upload:
+        body, status = ingest_upload(file.filename, upload, sha256)
+    return jsonify(body), status
+
+# Many files per request (or ZIP archives), extracted in parallel and
+# embedded and inserted in batches of chunks across file boundaries
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    def stored(filename, sha256):
+        cached = ingest_cache.get(sha256)
+        if cached is None:
+            return None
+        ingest_cache.add_filename(sha256, filename)
+        replace_previous_versions(filename, sha256)
+        return cached['filenames']
+
+    def chunked(items):
+        for item in items:
+            if item['status'] == 'extracted':
+                item['chunks'] = chunk_document(item['filename'], item['text'])
+            yield item
+
+    results = []
+    items = chunked(iter_extracted(iter_batch_files(request.files), skip=skip_duplicates(stored), excel_index=False))
+    for group in iter_groups(items, lambda item: len(item['chunks']), BATCH_INSERT_CHUNKS):
+        if group[0]['status'] == 'extracted':
+            try:
+                store_batch_in_chromadb(group)
+                for item in group:
+                    item.update(status='stored', chunks=len(item['chunks']))
+            except Exception as e:
+                logging.error(f"Error storing batch in ChromaDB: {e}")
+                for item in group:
+                    item.update(status='error', error=str(e), chunks=0)
+        for item in group:
+            item.pop('text', None)
+            results.append(item)
+    return jsonify(batch_summary(results)), 200
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job), 200
+
+# Top chunks for a query as [(id, document, metadata)]. 'hybrid' fuses the
+# dense and BM25 rankings by reciprocal rank; 'lexical' is the fast path
+# that skips embedding the query altogether.
+def retrieve(query, n_results=5, mode='hybrid'):
+    return retrieve_many([query], n_results, mode)[0]
+
+# retrieve() for many queries with one encode call and one Chroma query
+def retrieve_many(queries, n_results=5, mode='hybrid'):
+    rankings = [[] for _ in queries]
+    fetched = {}
+    if mode in ('hybrid', 'lexical'):
+        sync_bm25_index()
+        for ranking, query in zip(rankings, queries):
+            ranking.append([doc_id for doc_id, _ in bm25_index.search(query, RETRIEVE_CANDIDATES)])
+    if mode in ('hybrid', 'dense'):
+        query_vectors = embedding_cache.encode(list(queries)).tolist()
+        results = collection.query(query_embeddings=query_vectors, n_results=RETRIEVE_CANDIDATES)
+        for i, ranking in enumerate(rankings):
+            ranking.append(results['ids'][i])
+            fetched.update(zip(results['ids'][i], zip(results['documents'][i], results['metadatas'][i])))
+    fused = [reciprocal_rank_fusion(ranking)[:n_results] for ranking in rankings]
+    missing = list({doc_id for ids in fused for doc_id in ids if doc_id not in fetched})
+    if missing:
+        stored = collection.get(ids=missing, include=['documents', 'metadatas'])
+        fetched.update(zip(stored['ids'], zip(stored['documents'], stored['metadatas'])))
+    return [[(doc_id, *fetched[doc_id]) for doc_id in ids if doc_id in fetched] for ids in fused]
+
+def hit_sources(hits):
+    return [
+        {'filename': meta['filename'], 'chunk': meta.get('chunk'), 'start': meta.get('start'), 'end': meta.get('end')}
+        for _, _, meta in hits
+    ]
 
 @app.route('/retrieve_and_answer', methods=['POST'])
 def retrieve_and_answer():
     data = request.json
     query = data.get('query', '')
+    mode = data.get('mode', 'hybrid')
+    if mode not in RETRIEVE_MODES:
+        return jsonify({'error': f'Unknown mode, expected one of {RETRIEVE_MODES}'}), 400
 
     try:
-        # Generate query embedding
-        query_vector = embedding_model.encode(query).tolist()
-
-        # Retrieve similar vectors
-        results = collection.query(query_embeddings=[query_vector], n_results=5)  # Retrieve top 5 results
+        # Retrieve the top 5 chunks
+        hits = retrieve(query, n_results=5, mode=mode)
 
-        # Extract documents from results
-        documents = [result['document'] for result in results['documents']]
+        # Extract chunk texts and where they come from
+        documents = [document for _, document, _ in hits]
+        sources = hit_sources(hits)
 
         # Use the QA pipeline to generate an answer
         answer = generate_answer(query, documents)
 
-        return jsonify({'answer': answer}), 200
+        return jsonify({'answer': answer, 'sources': sources}), 200
     except Exception as e:
         logging.error(f"Error retrieving and answering: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Many questions per request: retrieval for all of them at once, then QA in
+# batches of (question, context) pairs, one NDJSON line per question as
+# each batch completes
+@app.route('/retrieve_and_answer/batch', methods=['POST'])
+def retrieve_and_answer_batch():
+    data = request.json
+    queries = data.get('queries', [])
+    mode = data.get('mode', 'hybrid')
+    if not isinstance(queries, list) or not queries:
+        return jsonify({'error': 'Expected a non-empty list of queries'}), 400
+    if mode not in RETRIEVE_MODES:
+        return jsonify({'error': f'Unknown mode, expected one of {RETRIEVE_MODES}'}), 400
+
+    try:
+        all_hits = retrieve_many(queries, n_results=5, mode=mode)
+    except Exception as e:
+        logging.error(f"Error retrieving batch: {e}")
+        return jsonify({'error': str(e)}), 500
+
+    def generate():
+        for first in range(0, len(queries), QA_BATCH_SIZE):
+            batch = range(first, min(first + QA_BATCH_SIZE, len(queries)))
+            try:
+                contexts = select_contexts([queries[i] for i in batch], [[document for _, document, _ in all_hits[i]] for i in batch])
+                answers = answer_many([queries[i] for i in batch], contexts)
+                lines = [
+                    {'index': i, 'query': queries[i], 'answer': answer, 'sources': hit_sources(all_hits[i])}
+                    for i, answer in zip(batch, answers)
+                ]
+            except Exception as e:
+                logging.error(f"Error answering batch: {e}")
+                lines = [{'index': i, 'query': queries[i], 'error': str(e)} for i in batch]
+            yield ''.join(json.dumps(line) + '\n' for line in lines)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# Load and exercise the models (all, or ?resource=name, repeatable) so the
+# first real request doesn't pay for it
+@app.route('/warmup', methods=['POST'])
+def warmup():
+    names = request.args.getlist('resource') or None
+    try:
+        seconds = warm_up(names)
+    except KeyError as e:
+        return jsonify({'error': str(e), 'resources': list(resource_status())}), 400
+    return jsonify({'warmed_up': seconds, 'resources': resource_status()}), 200
+
+# Readiness probe: 200 once every model is resident, 503 until then
+@app.route('/ready', methods=['GET'])
+def ready():
+    body = {'ready': all_loaded(), 'resources': resource_status(), 'startup': startup.as_dict()}
+    return jsonify(body), 200 if body['ready'] else 503
+
+@app.route('/embedding/stats', methods=['GET'])
+def embedding_stats():
+    return jsonify(dict(embedder.stats(), cache=embedding_cache.stats())), 200
+
+# Best passages of the documents for the query, kept in their original order
+def select_context(query, documents):
+    return select_contexts([query], [documents])[0]
+
+# select_context() for many queries, embedding all their passages together.
+# Overlapping chunks repeat the same passages; each distinct passage is
+# scored once and can fill the context only once.
+def select_contexts(queries, documents_per_query):
+    passages = [
+        list(dict.fromkeys(
+            passage.strip() for document in documents
+            for passage in split_passages(document, embedding_model.tokenizer, QA_PASSAGE_TOKENS)
+            if passage.strip()
+        ))
+        for documents in documents_per_query
+    ]
+    unique = list(dict.fromkeys(passage for query_passages in passages for passage in query_passages))
+    if not unique:
+        return ['' for _ in queries]
+    rows = {passage: i for i, passage in enumerate(unique)}
+    tokenizer = qa_pipeline.tokenizer
+    unique_lengths = np.array([len(ids) for ids in tokenizer(unique, add_special_tokens=False)['input_ids']])
+    # Passage embeddings come from the cache after the first time they are seen
+    unique_vectors = embedding_cache.encode(unique)
+    query_vectors = embedding_cache.encode(list(queries))
+    contexts = []
+    for query, query_vector, query_passages in zip(queries, query_vectors, passages):
+        query_rows = [rows[passage] for passage in query_passages]
+        lengths = unique_lengths[query_rows]
+        scores = unique_vectors[query_rows] @ query_vector
+        budget = QA_MAX_SEQ_LEN - len(tokenizer(query, add_special_tokens=False)['input_ids']) - 3  # [CLS] and two [SEP]
+        chosen, used = [], 0
+        for i in np.argsort(-scores):
+            if used + lengths[i] <= budget:
+                chosen.append(i)
+                used += lengths[i]
+        contexts.append(" ".join(query_passages[i] for i in sorted(chosen)))
+    return contexts
+
 def generate_answer(query, documents):
-    context = " ".join(documents)
-    result = qa_pipeline(question=query, context=context)
-    return result['answer']
+    return answer_many([query], [select_context(query, documents)])[0]
+
+# Answers for (question, context) pairs, run through the pipeline as one batch
+def answer_many(queries, contexts):
+    answers = ['' for _ in queries]
+    pending = [i for i, context in enumerate(contexts) if context]
+    if pending:
+        results = qa_pipeline(
+            question=[queries[i] for i in pending],
+            context=[contexts[i] for i in pending],
+            max_seq_len=QA_MAX_SEQ_LEN,
+            batch_size=QA_BATCH_SIZE
+        )
+        if isinstance(results, dict):
+            results = [results]
+        for i, result in zip(pending, results):
+            answers[i] = result['answer']
+    return answers
+
+startup.mark('init')
+logging.info(f"Startup report: {startup.as_dict()}")
 
 if __name__ == '__main__':
+    # Background jobs start here rather than at import, so processes that
+    # only import this module (spawned extraction pool workers re-import it
+    # as __mp_main__) never run them; with the debug reloader, only in the
+    # child that serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        ingest_jobs.recover()
+        ingest_jobs.start()
     app.run(debug=True, port=5001)
 
 
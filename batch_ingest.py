@@ -0,0 +1,164 @@
+# Shared pieces of the /upload/batch endpoints: files and ZIP members
+# extracted in parallel and handed back in input order for batched storage
+import hashlib
+import os
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from extraction import extract_text
+
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', os.cpu_count() or 1))
+BATCH_IN_FLIGHT = int(os.getenv('BATCH_IN_FLIGHT', BATCH_WORKERS * 4))
+BATCH_MAX_MEMBER_BYTES = int(os.getenv('BATCH_MAX_MEMBER_BYTES', 64 * 1024 * 1024))
+# ingest_batch stores this many documents at a time
+BATCH_INSERT_DOCS = 256
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt', '.xlsx')
+
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+
+def _get_batch_pool():
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            _batch_pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS)
+        return _batch_pool
+
+
+# Batch documents are keyed on their content hash, so files that share a
+# name (the same relative path in different ZIPs) can't collide
+def batch_doc_id(sha256):
+    return f"batch_{sha256}"
+
+
+# (filename, bytes) for every file in the request, ZIP members included;
+# bytes is None for a member larger than BATCH_MAX_MEMBER_BYTES, which is
+# not read (a ZIP member never yields more than its declared size)
+def iter_batch_files(request_files):
+    for file in request_files.getlist('files') + request_files.getlist('file'):
+        if file.filename == '':
+            continue
+        if file.filename.lower().endswith('.zip'):
+            with zipfile.ZipFile(file.stream) as archive:
+                for member in archive.infolist():
+                    if member.is_dir():
+                        continue
+                    if member.file_size > BATCH_MAX_MEMBER_BYTES:
+                        yield member.filename, None
+                    else:
+                        yield member.filename, archive.read(member)
+        else:
+            yield file.filename, file.stream.read()
+
+
+# Runs in a pool worker
+def _extract(filename, data, excel_index):
+    return extract_text(filename, BytesIO(data), pdf_workers=1, excel_index=excel_index)
+
+
+# Yields one dict per file, in input order: {'index', 'filename', 'sha256', 'status'}
+# plus 'text' when extracted or 'error'. skip(filename, sha256) may return a
+# status dict for files that should not be extracted (e.g. duplicates).
+def iter_extracted(files, skip=None, excel_index=True):
+    pool = _get_batch_pool()
+    pending = deque()
+
+    def finish(item):
+        future = item.pop('future', None)
+        if future is not None:
+            try:
+                text = future.result()
+                if text and text.strip():
+                    item.update(status='extracted', text=text)
+                else:
+                    item.update(status='error', error='No text found in file')
+            except Exception as e:
+                item.update(status='error', error=str(e))
+        return item
+
+    for index, (filename, data) in enumerate(files):
+        if data is None:
+            pending.append({'index': index, 'filename': filename, 'sha256': None, 'status': 'error',
+                            'error': f'File is larger than {BATCH_MAX_MEMBER_BYTES} bytes'})
+            continue
+        item = {'index': index, 'filename': filename, 'sha256': hashlib.sha256(data).hexdigest()}
+        if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+            item.update(status='error', error='Invalid file format')
+        else:
+            skipped = skip(filename, item['sha256']) if skip is not None else None
+            if skipped is not None:
+                item.update(skipped)
+            else:
+                item['future'] = pool.submit(_extract, filename, data, excel_index)
+        pending.append(item)
+        while len(pending) > BATCH_IN_FLIGHT or (pending and 'future' not in pending[0]):
+            yield finish(pending.popleft())
+    while pending:
+        yield finish(pending.popleft())
+
+
+# skip() for iter_extracted that reports a file as a duplicate, with
+# 'duplicate_of', when its content is already stored or came earlier in the
+# request. stored(filename, sha256) returns the filenames the content is
+# stored under, or None when it is not stored.
+def skip_duplicates(stored):
+    first_seen = {}
+
+    def skip(filename, sha256):
+        filenames = stored(filename, sha256)
+        if filenames is not None:
+            return {'status': 'duplicate', 'duplicate_of': filenames}
+        if sha256 in first_seen:
+            return {'status': 'duplicate', 'duplicate_of': [first_seen[sha256]]}
+        first_seen[sha256] = filename
+        return None
+    return skip
+
+
+# Group extracted items so each group holds at least min_units units (as
+# counted by size(item)); other items pass through as single-item groups
+# without waiting for the group they interrupt
+def iter_groups(items, size, min_units):
+    group, units = [], 0
+    for item in items:
+        if item['status'] != 'extracted':
+            yield [item]
+            continue
+        group.append(item)
+        units += size(item)
+        if units >= min_units:
+            yield group
+            group, units = [], 0
+    if group:
+        yield group
+
+
+# Extract the request's files and store them BATCH_INSERT_DOCS at a time
+# with store_documents(items), which returns their ids; returns the
+# batch_summary
+def ingest_batch(request_files, store_documents, skip=None):
+    results = []
+    items = iter_extracted(iter_batch_files(request_files), skip=skip)
+    for group in iter_groups(items, lambda item: 1, BATCH_INSERT_DOCS):
+        if group[0]['status'] == 'extracted':
+            try:
+                for item, doc_id in zip(group, store_documents(group)):
+                    item.update(status='stored', id=doc_id)
+            except Exception as e:
+                for item in group:
+                    item.update(status='error', error=str(e))
+        for item in group:
+            item.pop('text', None)
+            results.append(item)
+    return batch_summary(results)
+
+
+def batch_summary(results):
+    return {
+        'files': sorted(results, key=lambda result: result['index']),
+        'stored': sum(1 for result in results if result['status'] == 'stored'),
+        'failed': sum(1 for result in results if result['status'] == 'error'),
+    }
@@ -0,0 +1,124 @@
+# In-memory BM25 index for lexical retrieval next to the dense Chroma collection
+import math
+import re
+import threading
+from array import array
+import numpy as np
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+WORD_RE = re.compile(r'\w+(?:[-./]\w+)*')
+
+
+# Lower-cased words; compound identifiers also yield their parts
+def tokenize(text):
+    tokens = []
+    for match in WORD_RE.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r'[-./]', token) if part)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self.ids = []
+        self.positions = {}
+        self.lengths = array('i')
+        self.live = bytearray()  # 0 at the positions of removed documents
+        self.total_length = 0
+        self.postings = {}  # term -> (array of positions, array of term counts)
+
+    def __len__(self):
+        return len(self.positions)
+
+    # Ids currently indexed
+    def live_ids(self):
+        with self.lock:
+            return list(self.positions)
+
+    # Index documents; ids that are already indexed are left as they are,
+    # the same as Chroma's add
+    def add_many(self, ids, texts):
+        with self.lock:
+            for doc_id, text in zip(ids, texts):
+                if doc_id in self.positions:
+                    continue
+                position = len(self.ids)
+                self.positions[doc_id] = position
+                self.ids.append(doc_id)
+                tokens = tokenize(text or '')
+                self.lengths.append(len(tokens))
+                self.live.append(1)
+                self.total_length += len(tokens)
+                counts = {}
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for token, count in counts.items():
+                    postings = self.postings.get(token)
+                    if postings is None:
+                        postings = self.postings[token] = (array('i'), array('i'))
+                    postings[0].append(position)
+                    postings[1].append(count)
+
+    def remove_many(self, ids):
+        with self.lock:
+            for doc_id in ids:
+                position = self.positions.pop(doc_id, None)
+                if position is not None:
+                    self.live[position] = 0
+                    self.total_length -= self.lengths[position]
+
+    # [(doc_id, score)] for the k best BM25 matches
+    def search(self, query, k=5):
+        terms = set(tokenize(query))
+        with self.lock:
+            count = len(self.positions)
+            if count == 0:
+                return []
+            average_length = max(self.total_length / count, 1)
+            lengths = np.frombuffer(self.lengths, dtype=np.int32)[:len(self.ids)]
+            live = np.frombuffer(self.live, dtype=np.uint8)[:len(self.ids)].astype(bool)
+            matched, weights = [], []
+            for term in terms:
+                postings = self.postings.get(term)
+                if postings is None:
+                    continue
+                positions = np.frombuffer(postings[0], dtype=np.int32).copy()
+                tf = np.frombuffer(postings[1], dtype=np.int32).astype(np.float64)
+                keep = live[positions]
+                if not keep.all():
+                    positions, tf = positions[keep], tf[keep]
+                    if not len(positions):
+                        continue
+                idf = math.log(1 + (count - len(positions) + 0.5) / (len(positions) + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * lengths[positions] / average_length)
+                matched.append(positions)
+                weights.append(idf * tf * (self.k1 + 1) / (tf + norm))
+            # Views on the arrays must not outlive the lock: appending to an
+            # array that is exporting its buffer fails
+            del lengths
+            ids = self.ids
+        if not matched:
+            return []
+        positions, inverse = np.unique(np.concatenate(matched), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights))
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[positions[i]], float(scores[i])) for i in top]
+
+
+# Fuse several best-first id rankings: score(id) = sum of 1 / (RRF_K + rank)
+def reciprocal_rank_fusion(rankings, rrf_k=RRF_K):
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -1,24 +1,48 @@
 from flask import Flask, request, jsonify
-import pandas as pd
-from PyPDF2 import PdfReader
-import os
-from docx import Document
-from sklearn.feature_extraction.text import TfidfVectorizer
+from extraction import iter_pdf_pages, iter_docx_paragraphs, iter_txt_blocks, iter_excel_blocks
+from uploads import open_upload, UploadRequest
+from sparse_vectorizer import SparseVectorizer, SparseIndex, to_sparse_dict
+from vector_format import vector_response
+from batch_ingest import batch_doc_id, ingest_batch, skip_duplicates
 import chromadb
 import numpy as np
 
 app = Flask(__name__)
-UPLOAD_FOLDER = "D:/Disruptive Ai/New folder"
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.request_class = UploadRequest  # uploads up to UPLOAD_SPILL_BYTES stay in memory
 
 # Initialize Chroma client and collection
 client = chromadb.Client()
 collection = client.create_collection(name="text_vectors")
 
+# One corpus-wide vectorizer, so every document gets comparable vectors.
+# Chroma requires one embedding dimension per collection, so the hashing
+# space is kept small enough to store densely.
+CHROMA_N_FEATURES = 4096
+vectorizer = SparseVectorizer('chroma_db', n_features=CHROMA_N_FEATURES)
+
+# Exact search over the sparse vectors, scored by sparse dot product
+sparse_index = SparseIndex()
+
 def vectorize_text(text):
-    vectorizer = TfidfVectorizer()
-    vectors = vectorizer.fit_transform([text])
-    return vectors.toarray()[0].tolist()  # Convert to list
+    return vectorizer.transform(text)
+
+# Store one document in Chroma and the sparse index, replacing an earlier
+# upload under the same id in both; returns the sparse vector
+def store_document(doc_id, text):
+    vector = vectorize_text(text)
+    collection.upsert(documents=[text], embeddings=[vector.toarray()[0].tolist()], ids=[doc_id])
+    sparse_index.add(doc_id, vector)
+    return to_sparse_dict(vector)
+
+# Store several extracted files with one vectorizer update and one insert
+def store_documents(items):
+    doc_ids = [batch_doc_id(item['sha256']) for item in items]
+    vectors = vectorizer.transform_many([item['text'] for item in items])
+    collection.add(documents=[item['text'] for item in items], embeddings=vectors.toarray().tolist(),
+                   metadatas=[{'filename': item['filename']} for item in items], ids=doc_ids)
+    for i, doc_id in enumerate(doc_ids):
+        sparse_index.add(doc_id, vectors[i])
+    return doc_ids
 
 @app.route('/upload/excel', methods=['POST'])
 def upload_excel():
@@ -28,16 +52,13 @@ def upload_excel():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     if file and file.filename.endswith('.xlsx'):
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(file_path)
-        df = pd.read_excel(file_path)
-        text = df.to_string()
-        vector = vectorize_text(text)
+        with open_upload(file) as upload:
+            text = ''.join(iter_excel_blocks(upload))
         # Create a unique ID for the document
         doc_id = f"excel_{file.filename}"
         # Store vector in ChromaDB with ID
-        collection.add(documents=[text], embeddings=[vector], ids=[doc_id])
-        return jsonify({'vector': vector}), 200
+        vector = store_document(doc_id, text)
+        return vector_response(vector)
     return jsonify({'error': 'Invalid file format'}), 400
 
 @app.route('/upload/pdf', methods=['POST'])
@@ -48,19 +69,13 @@ def upload_pdf():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     if file and file.filename.endswith('.pdf'):
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(file_path)
-        text = ''
-        with open(file_path, 'rb') as f:
-            reader = PdfReader(f)
-            for page in reader.pages:
-                text += page.extract_text()
-        vector = vectorize_text(text)
+        with open_upload(file) as upload:
+            text = ''.join(iter_pdf_pages(upload))
         # Create a unique ID for the document
         doc_id = f"pdf_{file.filename}"
         # Store vector in ChromaDB with ID
-        collection.add(documents=[text], embeddings=[vector], ids=[doc_id])
-        return jsonify({'vector': vector}), 200
+        vector = store_document(doc_id, text)
+        return vector_response(vector)
     return jsonify({'error': 'Invalid file format'}), 400
 
 @app.route('/upload/document', methods=['POST'])
@@ -71,20 +86,16 @@ def upload_document():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     if file and (file.filename.endswith('.txt') or file.filename.endswith('.docx')):
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(file_path)
-        if file.filename.endswith('.txt'):
-            with open(file_path, 'r') as f:
-                text = f.read()
-        elif file.filename.endswith('.docx'):
-            doc = Document(file_path)
-            text = '\n'.join([para.text for para in doc.paragraphs])
-        vector = vectorize_text(text)
+        with open_upload(file) as upload:
+            if file.filename.endswith('.txt'):
+                text = ''.join(iter_txt_blocks(upload))
+            elif file.filename.endswith('.docx'):
+                text = '\n'.join(iter_docx_paragraphs(upload))
         # Create a unique ID for the document
         doc_id = f"document_{file.filename}"
         # Store vector in ChromaDB with ID
-        collection.add(documents=[text], embeddings=[vector], ids=[doc_id])
-        return jsonify({'vector': vector}), 200
+        vector = store_document(doc_id, text)
+        return vector_response(vector)
     return jsonify({'error': 'Invalid file format'}), 400
 
 @app.route('/upload/all', methods=['POST'])
@@ -94,34 +105,50 @@ def upload_all():
     file = request.files['file']
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-    file.save(file_path)
-    
-    text = ''
-    if file.filename.endswith('.xlsx'):
-        df = pd.read_excel(file_path)
-        text = df.to_string()
-    elif file.filename.endswith('.pdf'):
-        with open(file_path, 'rb') as f:
-            reader = PdfReader(f)
-            for page in reader.pages:
-                text += page.extract_text()
-    elif file.filename.endswith('.txt'):
-        with open(file_path, 'r') as f:
-            text = f.read()
-    elif file.filename.endswith('.docx'):
-        doc = Document(file_path)
-        text = '\n'.join([para.text for para in doc.paragraphs])
+    with open_upload(file) as upload:
+        text = ''
+        if file.filename.endswith('.xlsx'):
+            text = ''.join(iter_excel_blocks(upload))
+        elif file.filename.endswith('.pdf'):
+            text = ''.join(iter_pdf_pages(upload))
+        elif file.filename.endswith('.txt'):
+            text = ''.join(iter_txt_blocks(upload))
+        elif file.filename.endswith('.docx'):
+            text = '\n'.join(iter_docx_paragraphs(upload))
     
     if text:
-        vector = vectorize_text(text)
         # Create a unique ID for the document
         doc_id = f"all_{file.filename}"
         # Store vector in ChromaDB with ID
-        collection.add(documents=[text], embeddings=[vector], ids=[doc_id])
-        return jsonify({'vector': vector}), 200
+        vector = store_document(doc_id, text)
+        return vector_response(vector)
 
     return jsonify({'error': 'Invalid file format'}), 400
 
+# Many files per request (or ZIP archives), extracted in parallel
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    # Content already stored is neither re-vectorized nor counted again in
+    # the vectorizer's document frequencies
+    def stored(filename, sha256):
+        found = collection.get(ids=[batch_doc_id(sha256)], include=['metadatas'])
+        if not found['ids']:
+            return None
+        return [metadata['filename'] for metadata in found['metadatas'] if metadata and 'filename' in metadata]
+    return jsonify(ingest_batch(request.files, store_documents, skip_duplicates(stored))), 200
+
+@app.route('/search', methods=['POST'])
+def search():
+    data = request.json
+    query = data.get('query', '')
+    k = int(data.get('k', 5))
+    hits = sparse_index.search(vectorizer.transform(query, update=False), k)
+    if not hits:
+        return jsonify({'results': []}), 200
+    stored = collection.get(ids=[doc_id for doc_id, _ in hits])
+    documents = dict(zip(stored['ids'], stored['documents']))
+    results = [{'id': doc_id, 'score': score, 'document': documents.get(doc_id)} for doc_id, score in hits]
+    return jsonify({'results': results}), 200
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,93 @@
+# Token-budgeted chunking with character offsets, sized for all-MiniLM-L6-v2
+import re
+
+CHUNK_TOKENS = 254  # 256 word-pieces minus [CLS] and [SEP]
+CHUNK_OVERLAP = 32
+
+
+# Character spans of the tokens in text; uses the model's fast tokenizer
+# when given, whitespace-separated words otherwise
+def token_spans(text, tokenizer=None):
+    if tokenizer is None:
+        return [match.span() for match in re.finditer(r'\S+', text)]
+    encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+    return [span for span in encoding['offset_mapping'] if span[1] > span[0]]
+
+
+# Split text into chunks of at most max_tokens tokens, consecutive chunks
+# sharing overlap tokens. Each chunk is {'text', 'start', 'end'} where
+# text == source[start:end].
+def chunk_text(text, tokenizer=None, max_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    spans = token_spans(text, tokenizer)
+    step = max(1, max_tokens - overlap)
+    chunks = []
+    for first in range(0, len(spans), step):
+        last = min(first + max_tokens, len(spans)) - 1
+        start, end = spans[first][0], spans[last][1]
+        chunks.append({'text': text[start:end], 'start': start, 'end': end})
+        if last == len(spans) - 1:
+            break
+    return chunks
+
+
+# Chunks of a table extracted by extraction.iter_excel_blocks, where a
+# 'Sheet: <name>' line and a header line start every row group. Whole rows
+# are packed into chunks of at most max_tokens tokens, each starting with
+# its sheet and header lines so it keeps the column names; 'start'/'end'
+# span the chunk's rows in text, with the two lines prepended to 'text'.
+def chunk_table_text(text, tokenizer=None, max_tokens=CHUNK_TOKENS):
+    chunks = []
+    span = []  # [start, end] of the rows in the current chunk
+    context, budget, used = '', max_tokens, 0
+    sheet_line = None
+
+    def flush():
+        if span:
+            start, end = span
+            chunks.append({'text': context + text[start:end], 'start': start, 'end': end})
+            span.clear()
+
+    for match in re.finditer(r'[^\n]+', text):
+        line = match.group()
+        if line.startswith('Sheet: '):
+            flush()
+            sheet_line = line
+            continue
+        if sheet_line is not None:
+            # The line after 'Sheet:' is the header of this row group
+            context = f'{sheet_line}\n{line}\n'
+            budget = max(max_tokens // 2, max_tokens - len(token_spans(context, tokenizer)))
+            sheet_line, used = None, 0
+            continue
+        tokens = len(token_spans(line, tokenizer))
+        if tokens > budget:
+            # A row too long for one chunk is split on its own
+            flush()
+            for piece in chunk_text(line, tokenizer, budget, overlap=0):
+                start, end = match.start() + piece['start'], match.start() + piece['end']
+                chunks.append({'text': context + piece['text'], 'start': start, 'end': end})
+            used = 0
+            continue
+        if span and used + tokens > budget:
+            flush()
+            used = 0
+        if span:
+            span[1] = match.end()
+        else:
+            span.extend(match.span())
+        used += tokens
+    flush()
+    return chunks
+
+
+SENTENCE_BREAK_RE = re.compile(r'(?<=[.!?])\s+|\n+')
+
+
+# Sentence-sized passages of text, with sentences longer than max_tokens
+# tokens split further
+def split_passages(text, tokenizer=None, max_tokens=64):
+    passages = []
+    for sentence in SENTENCE_BREAK_RE.split(text):
+        if sentence.strip():
+            passages.extend(chunk['text'] for chunk in chunk_text(sentence, tokenizer, max_tokens, overlap=0))
+    return passages
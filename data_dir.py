@@ -0,0 +1,9 @@
+# Local state (caches, job queue, indexes, models) defaults to paths under DATA_DIR
+import os
+
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+
+
+def data_path(*parts):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, *parts)
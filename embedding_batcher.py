@@ -0,0 +1,93 @@
+# Dynamic micro-batching for SentenceTransformer.encode across request threads
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+EMBED_MAX_BATCH_SIZE = int(os.getenv('EMBED_MAX_BATCH_SIZE', 32))
+EMBED_MAX_WAIT_MS = float(os.getenv('EMBED_MAX_WAIT_MS', 10))
+
+
+class EmbeddingBatcher:
+    def __init__(self, model, max_batch_size=EMBED_MAX_BATCH_SIZE, max_wait_ms=EMBED_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._start()
+        # A forked child (e.g. a pre-fork server worker) gets no threads, so
+        # it starts its own worker and queue
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self.queue = queue.Queue()
+        self.stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.last_batch_size = 0
+        self.largest_batch_size = 0
+        self.worker = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+        self.worker.start()
+
+    # Queue one text; the future resolves to its embedding
+    def submit(self, text):
+        future = Future()
+        self.queue.put((text, future))
+        return future
+
+    # Same contract as model.encode: a str gives one vector, a list gives a matrix
+    def encode(self, texts):
+        if isinstance(texts, str):
+            return self.submit(texts).result()
+        futures = [self.submit(text) for text in texts]
+        if not futures:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        return np.stack([future.result() for future in futures])
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'batches': self.batches,
+                'items': self.items,
+                'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+                'last_batch_size': self.last_batch_size,
+                'largest_batch_size': self.largest_batch_size,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+            }
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # Drain what is already queued, then wait out the deadline
+                batch.append(self.queue.get_nowait() if remaining <= 0 else self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [(text, future) for text, future in self._next_batch() if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            texts = [text for text, _ in batch]
+            futures = [future for _, future in batch]
+            try:
+                vectors = self.model.encode(texts, batch_size=len(texts))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, vector in zip(futures, vectors):
+                future.set_result(vector)
+            with self.stats_lock:
+                self.batches += 1
+                self.items += len(texts)
+                self.last_batch_size = len(texts)
+                self.largest_batch_size = max(self.largest_batch_size, len(texts))
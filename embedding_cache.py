@@ -0,0 +1,105 @@
+# Two-tier embedding cache (in-process LRU, then disk) for ingestion and queries
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from data_dir import data_path
+
+EMBEDDING_CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR', data_path('embedding_cache'))
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv('EMBEDDING_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+
+def normalize_text(text):
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', text)).strip()
+
+
+class EmbeddingCache:
+    def __init__(self, model_name, encode, path=EMBEDDING_CACHE_DIR, max_bytes=EMBEDDING_CACHE_MAX_BYTES):
+        self.model_name = model_name
+        self.encode_fn = encode
+        self.path = os.path.join(path, re.sub(r'[^\w.-]', '_', model_name))
+        self.max_bytes = max_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        os.makedirs(self.path, exist_ok=True)
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key + '.f32')
+
+    def _remember(self, key, vector):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return
+            self.memory[key] = vector
+            self.memory_bytes += vector.nbytes
+            while self.memory_bytes > self.max_bytes and len(self.memory) > 1:
+                _, evicted = self.memory.popitem(last=False)
+                self.memory_bytes -= evicted.nbytes
+
+    def _lookup(self, key):
+        with self.lock:
+            vector = self.memory.get(key)
+            if vector is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+        try:
+            with open(self._file(key), 'rb') as f:
+                vector = np.frombuffer(f.read(), dtype=np.float32)
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            self.disk_hits += 1
+        self._remember(key, vector)
+        return vector
+
+    def _store(self, key, vector):
+        file_path = self._file(key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # Write then rename so a concurrent reader never sees a partial vector
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(vector.tobytes())
+        os.replace(tmp_path, file_path)
+        self._remember(key, vector)
+
+    # Same contract as model.encode: a str gives one vector, a list gives a matrix
+    def encode(self, texts):
+        if isinstance(texts, str):
+            return self.encode([texts])[0]
+        keys = [self.key(text) for text in texts]
+        vectors = [self._lookup(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            with self.lock:
+                self.misses += len(missing)
+            encoded = np.asarray(self.encode_fn([texts[i] for i in missing]), dtype=np.float32)
+            for i, vector in zip(missing, encoded):
+                vector = np.ascontiguousarray(vector)
+                self._store(keys[i], vector)
+                vectors[i] = vector
+        if not vectors:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack(vectors)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'memory_entries': len(self.memory),
+                'memory_bytes': self.memory_bytes,
+                'max_bytes': self.max_bytes,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+            }
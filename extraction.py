@@ -0,0 +1,247 @@
+# Shared page-by-page text extraction generators for the upload services
+import datetime
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+TXT_BLOCK_SIZE = 64 * 1024
+EXCEL_BLOCK_ROWS = 1000
+
+# Parallel PDF extraction: documents with fewer pages than the threshold are
+# parsed on the calling thread, since starting work on the pool costs more
+# than it saves for short files.
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', os.cpu_count() or 1))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 64))
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', 0))  # 0 = split evenly across workers
+
+_pdf_pools = {}  # worker count -> pool
+_pdf_pools_lock = threading.Lock()
+
+
+# PDF pages with PyPDF2
+def iter_pdf_pages(source):
+    from PyPDF2 import PdfReader
+    reader = PdfReader(source)
+    for page in reader.pages:
+        yield page.extract_text() or ''
+
+
+# PDF pages with PyMuPDF (fitz)
+def iter_pdf_pages_fitz(source):
+    doc = _open_pdf(_pdf_source(source), 'fitz')
+    try:
+        for page in doc:
+            yield page.get_text()
+    finally:
+        doc.close()
+
+
+# Paths and bytes pass through; a spilled upload becomes its temp file path
+# and an in-memory one its bytes, so either can be sent to pool workers
+def _pdf_source(source):
+    if isinstance(source, (str, bytes)):
+        return source
+    name = getattr(source, 'name', None)
+    if isinstance(name, str) and os.path.exists(name):
+        return name
+    if isinstance(source, io.BytesIO):
+        return source.getvalue()
+    source.seek(0)
+    return source.read()
+
+
+def _open_pdf(source, engine):
+    if engine == 'fitz':
+        import fitz
+        if isinstance(source, bytes):
+            return fitz.open(stream=source, filetype='pdf')
+        return fitz.open(source)
+    from PyPDF2 import PdfReader
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    return PdfReader(source)
+
+
+def _pdf_page_count(doc, engine):
+    return doc.page_count if engine == 'fitz' else len(doc.pages)
+
+
+def _pdf_page_text(doc, number, engine):
+    if engine == 'fitz':
+        return doc[number].get_text()
+    return doc.pages[number].extract_text() or ''
+
+
+# Runs in a pool worker: text of pages [start, end) of one PDF
+def _extract_pdf_range(source, start, end, engine):
+    doc = _open_pdf(source, engine)
+    try:
+        return [_pdf_page_text(doc, number, engine) for number in range(start, end)]
+    finally:
+        if engine == 'fitz':
+            doc.close()
+
+
+# One pool per worker count, kept for the life of the process, so a caller
+# asking for another size never shuts down a pool that is still in use
+def _get_pdf_pool(workers):
+    with _pdf_pools_lock:
+        pool = _pdf_pools.get(workers)
+        if pool is None:
+            pool = _pdf_pools[workers] = ProcessPoolExecutor(max_workers=workers)
+        return pool
+
+
+# PDF pages extracted on a process pool in page ranges, yielded back in order.
+def iter_pdf_pages_parallel(source, engine='pypdf2', workers=None, min_pages=None, pages_per_task=None):
+    source = _pdf_source(source)
+    workers = workers or PDF_WORKERS
+    min_pages = PDF_PARALLEL_MIN_PAGES if min_pages is None else min_pages
+    pages_per_task = pages_per_task or PDF_PAGES_PER_TASK
+
+    doc = _open_pdf(source, engine)
+    try:
+        page_count = _pdf_page_count(doc, engine)
+        if workers <= 1 or page_count < min_pages:
+            for number in range(page_count):
+                yield _pdf_page_text(doc, number, engine)
+            return
+    finally:
+        if engine == 'fitz':
+            doc.close()
+
+    if not pages_per_task:
+        pages_per_task = -(-page_count // workers)
+    pool = _get_pdf_pool(workers)
+    futures = [
+        pool.submit(_extract_pdf_range, source, start, min(start + pages_per_task, page_count), engine)
+        for start in range(0, page_count, pages_per_task)
+    ]
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+# DOCX paragraphs
+def iter_docx_paragraphs(source):
+    from docx import Document
+    doc = Document(source)
+    for para in doc.paragraphs:
+        yield para.text
+
+
+# Plain text in fixed-size blocks
+def iter_txt_blocks(source, block_size=TXT_BLOCK_SIZE):
+    f = open(source, 'r') if isinstance(source, str) else io.TextIOWrapper(source)
+    try:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            yield block
+    finally:
+        if isinstance(source, str):
+            f.close()
+        else:
+            f.detach()  # leave the caller's file object open
+
+
+def _cell_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+# Column names from a header row: blank cells become column_<n> and a
+# repeated name gets a suffix (id, id_2, ...) so no cell overwrites another
+def _header_names(row):
+    names, seen = [], set()
+    for i, value in enumerate(row):
+        base = str(value) if value is not None else f'column_{i + 1}'
+        name, n = base, 2
+        while name in seen:
+            name, n = f'{base}_{n}', n + 1
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+# Rows of every sheet, streamed with openpyxl in read-only mode so only the
+# current row is held in memory. The first non-empty row of a sheet is its
+# header; each data row is {'sheet', 'row', 'values': {header: value}} with
+# JSON-friendly values and row the 1-based row number in the sheet.
+def iter_excel_rows(source):
+    from openpyxl import load_workbook
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            header = None
+            for number, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+                if all(value is None for value in row):
+                    continue
+                if header is None:
+                    header = _header_names(row)
+                    continue
+                if len(row) > len(header):
+                    header = _header_names(header + [None] * (len(row) - len(header)))
+                values = {name: _cell_value(value) for name, value in zip(header, row)}
+                yield {'sheet': sheet.title, 'row': number, 'values': values}
+    finally:
+        workbook.close()
+
+
+# Excel rows as text blocks of up to block_rows rows, every block starting
+# with its sheet name and header so each can be embedded on its own
+def iter_excel_blocks(source, index=True, block_rows=EXCEL_BLOCK_ROWS):
+    sheet, lines = None, []
+    first = True
+    for row in iter_excel_rows(source):
+        if lines and (row['sheet'] != sheet or len(lines) - 2 >= block_rows):
+            yield ('' if first else '\n') + '\n'.join(lines)
+            first = False
+            lines = []
+        if not lines:
+            sheet = row['sheet']
+            header = ' | '.join(row['values'])
+            lines = [f'Sheet: {sheet}', f'row | {header}' if index else header]
+        cells = ' | '.join('' if value is None else str(value) for value in row['values'].values())
+        lines.append(f"{row['row']} | {cells}" if index else cells)
+    if lines:
+        yield ('' if first else '\n') + '\n'.join(lines)
+
+
+# Yield blocks with a separator between them, same result as sep.join(blocks)
+def iter_joined(blocks, sep):
+    first = True
+    for block in blocks:
+        if not first:
+            yield sep
+        first = False
+        yield block
+
+
+# Pick the extractor for a filename; returns None for unsupported formats.
+# pdf_workers=1 keeps PDF extraction on the calling process.
+def iter_file_text(filename, source, pdf_engine='pypdf2', pdf_workers=None, excel_index=True):
+    if filename.endswith('.pdf'):
+        return iter_pdf_pages_parallel(source, engine=pdf_engine, workers=pdf_workers)
+    if filename.endswith('.docx'):
+        return iter_joined(iter_docx_paragraphs(source), '\n')
+    if filename.endswith('.txt'):
+        return iter_txt_blocks(source)
+    if filename.endswith('.xlsx'):
+        return iter_excel_blocks(source, index=excel_index)
+    return None
+
+
+def extract_text(filename, source, pdf_engine='pypdf2', pdf_workers=None, excel_index=True):
+    blocks = iter_file_text(filename, source, pdf_engine=pdf_engine, pdf_workers=pdf_workers, excel_index=excel_index)
+    if blocks is None:
+        return None
+    return ''.join(blocks)
@@ -1,31 +1,89 @@
 from flask import Flask, request, jsonify
-import pandas as pd
-from PyPDF2 import PdfReader
+from extraction import iter_pdf_pages, iter_docx_paragraphs, iter_txt_blocks, iter_excel_blocks
+from uploads import open_upload, UploadRequest
+from sparse_vectorizer import SparseVectorizer, to_sparse_dict
+from batch_ingest import batch_doc_id, ingest_batch, skip_duplicates
+from firestore_store import FirestoreStore, firestore_client
+from ann_index import AnnIndex
+from lazy_resources import LazyResource
+from data_dir import data_path
+import atexit
 import os
-from docx import Document
-from sklearn.feature_extraction.text import TfidfVectorizer
-import firebase_admin
-from firebase_admin import credentials, firestore
 import re
+import threading
+import time
 
 app = Flask(__name__)
-UPLOAD_FOLDER = "D:/Disruptive Ai/New folder"
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.request_class = UploadRequest  # uploads up to UPLOAD_SPILL_BYTES stay in memory
 
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate('D:/Disruptive Ai/agent-79934-firebase-adminsdk-ll7wr-2f2c46853e.json')  # Update this path
-firebase_admin.initialize_app(cred)
-db = firestore.client()  # Initialize Firestore client
+# Initialize Firestore (the local emulator when FIRESTORE_EMULATOR_HOST is set)
+FIREBASE_CREDENTIALS = os.getenv('FIREBASE_CREDENTIALS', 'D:/Disruptive Ai/agent-79934-firebase-adminsdk-ll7wr-2f2c46853e.json')  # Update this path
+db = firestore_client(FIREBASE_CREDENTIALS)
+# Text and vectors are split across chunk subdocuments
+store = FirestoreStore(db)
+
+# One corpus-wide vectorizer, so every document gets comparable vectors
+vectorizer = SparseVectorizer('firebase')
 
 def vectorize_text(text):
-    vectorizer = TfidfVectorizer()
-    vectors = vectorizer.fit_transform([text])
-    return vectors.toarray()[0].tolist()  # Convert NumPy array to list
+    return to_sparse_dict(vectorizer.transform(text))  # Only the non-zero entries
+
+# Approximate nearest-neighbour index over the stored vectors for /search,
+# built on first use (never at import, which spawned extraction workers
+# repeat): it starts from the local snapshot, fetches whatever changed in
+# Firestore since, and is updated as uploads are stored.
+ANN_SNAPSHOT_PATH = os.getenv('ANN_SNAPSHOT_PATH', data_path('firebase_ann.npz'))
+ANN_SNAPSHOT_EVERY = int(os.getenv('ANN_SNAPSHOT_EVERY', 100))
+ANN_SYNC_MARGIN_SECONDS = 60  # allowance for clock skew between writers
+ann_lock = threading.Lock()
+ann_unsaved = [0]
+
+def load_ann_index():
+    index = AnnIndex()
+    started = time.time()
+    since = None
+    if index.load(ANN_SNAPSHOT_PATH) and index.synced_at is not None:
+        since = index.synced_at - ANN_SYNC_MARGIN_SECONDS
+    for doc_id, vector in store.iter_vectors(since):
+        index.add(doc_id, vector)
+    index.mark_synced(started)
+    index.save(ANN_SNAPSHOT_PATH)
+    # Only the process that loaded the index snapshots it on exit
+    atexit.register(save_ann_index)
+    return index
+
+ann_index = LazyResource('ann_index', load_ann_index)
+
+def save_ann_index():
+    with ann_lock:
+        ann_unsaved[0] = 0
+    ann_index.save(ANN_SNAPSHOT_PATH)
+
+def index_document(doc_id, vector):
+    ann_index.add(doc_id, vector)
+    with ann_lock:
+        ann_unsaved[0] += 1
+        due = ann_unsaved[0] >= ANN_SNAPSHOT_EVERY
+    if due:
+        save_ann_index()
 
 def sanitize_id(filename):
     # Remove any characters not allowed in Firestore document IDs
     return re.sub(r'[^\w\s]', '_', filename)
 
+# Store several extracted files with one vectorizer update and one bulk write
+def store_documents(items):
+    vectors = vectorizer.transform_many([item['text'] for item in items])
+    doc_ids = [batch_doc_id(item['sha256']) for item in items]
+    sparse_vectors = [to_sparse_dict(vectors[i]) for i in range(len(items))]
+    store.put_many(
+        (doc_id, item['text'], vector, {'filename': item['filename']})
+        for doc_id, item, vector in zip(doc_ids, items, sparse_vectors)
+    )
+    for doc_id, vector in zip(doc_ids, sparse_vectors):
+        index_document(doc_id, vector)
+    return doc_ids
+
 @app.route('/upload/excel', methods=['POST'])
 def upload_excel():
     if 'file' not in request.files:
@@ -35,17 +93,13 @@ def upload_excel():
         return jsonify({'error': 'No selected file'}), 400
     if file and file.filename.endswith('.xlsx'):
         try:
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-            file.save(file_path)
-            df = pd.read_excel(file_path)
-            text = df.to_string()
+            with open_upload(file) as upload:
+                text = ''.join(iter_excel_blocks(upload))
             vector = vectorize_text(text)
             doc_id = sanitize_id(f"excel_{file.filename}")
             # Store data in Firestore
-            db.collection('documents').document(doc_id).set({
-                'text': text,
-                'vector': vector
-            })
+            store.put(doc_id, text, vector, {'filename': file.filename})
+            index_document(doc_id, vector)
             return jsonify({'vector': vector}), 200
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -60,20 +114,13 @@ def upload_pdf():
         return jsonify({'error': 'No selected file'}), 400
     if file and file.filename.endswith('.pdf'):
         try:
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-            file.save(file_path)
-            text = ''
-            with open(file_path, 'rb') as f:
-                reader = PdfReader(f)
-                for page in reader.pages:
-                    text += page.extract_text()
+            with open_upload(file) as upload:
+                text = ''.join(iter_pdf_pages(upload))
             vector = vectorize_text(text)
             doc_id = sanitize_id(f"pdf_{file.filename}")
             # Store data in Firestore
-            db.collection('documents').document(doc_id).set({
-                'text': text,
-                'vector': vector
-            })
+            store.put(doc_id, text, vector, {'filename': file.filename})
+            index_document(doc_id, vector)
             return jsonify({'vector': vector}), 200
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -88,21 +135,16 @@ def upload_document():
         return jsonify({'error': 'No selected file'}), 400
     if file and (file.filename.endswith('.txt') or file.filename.endswith('.docx')):
         try:
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-            file.save(file_path)
-            if file.filename.endswith('.txt'):
-                with open(file_path, 'r') as f:
-                    text = f.read()
-            elif file.filename.endswith('.docx'):
-                doc = Document(file_path)
-                text = '\n'.join([para.text for para in doc.paragraphs])
+            with open_upload(file) as upload:
+                if file.filename.endswith('.txt'):
+                    text = ''.join(iter_txt_blocks(upload))
+                elif file.filename.endswith('.docx'):
+                    text = '\n'.join(iter_docx_paragraphs(upload))
             vector = vectorize_text(text)
             doc_id = sanitize_id(f"document_{file.filename}")
             # Store data in Firestore
-            db.collection('documents').document(doc_id).set({
-                'text': text,
-                'vector': vector
-            })
+            store.put(doc_id, text, vector, {'filename': file.filename})
+            index_document(doc_id, vector)
             return jsonify({'vector': vector}), 200
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -116,37 +158,48 @@ def upload_all():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     try:
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(file_path)
-        
-        text = ''
-        if file.filename.endswith('.xlsx'):
-            df = pd.read_excel(file_path)
-            text = df.to_string()
-        elif file.filename.endswith('.pdf'):
-            with open(file_path, 'rb') as f:
-                reader = PdfReader(f)
-                for page in reader.pages:
-                    text += page.extract_text()
-        elif file.filename.endswith('.txt'):
-            with open(file_path, 'r') as f:
-                text = f.read()
-        elif file.filename.endswith('.docx'):
-            doc = Document(file_path)
-            text = '\n'.join([para.text for para in doc.paragraphs])
+        with open_upload(file) as upload:
+            text = ''
+            if file.filename.endswith('.xlsx'):
+                text = ''.join(iter_excel_blocks(upload))
+            elif file.filename.endswith('.pdf'):
+                text = ''.join(iter_pdf_pages(upload))
+            elif file.filename.endswith('.txt'):
+                text = ''.join(iter_txt_blocks(upload))
+            elif file.filename.endswith('.docx'):
+                text = '\n'.join(iter_docx_paragraphs(upload))
         
         if text:
             vector = vectorize_text(text)
             doc_id = sanitize_id(f"all_{file.filename}")
             # Store data in Firestore
-            db.collection('documents').document(doc_id).set({
-                'text': text,
-                'vector': vector
-            })
+            store.put(doc_id, text, vector, {'filename': file.filename})
+            index_document(doc_id, vector)
             return jsonify({'vector': vector}), 200
         return jsonify({'error': 'No text extracted'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Many files per request (or ZIP archives), extracted in parallel
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    # Content already stored (the ANN index mirrors the store) is neither
+    # re-vectorized nor counted again in the vectorizer's document frequencies
+    def stored(filename, sha256):
+        doc_id = batch_doc_id(sha256)
+        if doc_id not in ann_index.resource():
+            return None
+        fields = store.get_fields(doc_id, ['filename']) or {}
+        return [fields['filename']] if 'filename' in fields else []
+    return jsonify(ingest_batch(request.files, store_documents, skip_duplicates(stored))), 200
+
+@app.route('/search', methods=['POST'])
+def search():
+    data = request.json
+    query = data.get('query', '')
+    k = int(data.get('k', 5))
+    hits = ann_index.search(to_sparse_dict(vectorizer.transform(query, update=False)), k)
+    return jsonify({'results': [{'id': doc_id, 'score': score} for doc_id, score in hits]}), 200
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,228 @@
+# Chunked Firestore storage for firebase.py; python firestore_store.py does a
+# round trip against the emulator at FIRESTORE_EMULATOR_HOST
+import os
+import time
+import numpy as np
+
+FIRESTORE_COLLECTION = os.getenv('FIRESTORE_COLLECTION', 'documents')
+FIRESTORE_PROJECT = os.getenv('FIRESTORE_PROJECT', 'demo-project')
+# Per chunk: at most 4 bytes per character of text plus 8 bytes per non-zero
+FIRESTORE_CHUNK_CHARS = int(os.getenv('FIRESTORE_CHUNK_CHARS', 160_000))
+FIRESTORE_CHUNK_NNZ = int(os.getenv('FIRESTORE_CHUNK_NNZ', 32_000))
+FIRESTORE_MAX_OPS_PER_SECOND = int(os.getenv('FIRESTORE_MAX_OPS_PER_SECOND', 500))
+FIRESTORE_MAX_ATTEMPTS = int(os.getenv('FIRESTORE_MAX_ATTEMPTS', 5))
+FIRESTORE_BACKOFF_SECONDS = float(os.getenv('FIRESTORE_BACKOFF_SECONDS', 0.5))
+# Firestore allows at most 500 writes and 10 MiB per commit; a chunk can be
+# close to 1 MiB, so commits are also cut by size, with some headroom
+FIRESTORE_BATCH_WRITES = 500
+FIRESTORE_BATCH_BYTES = int(os.getenv('FIRESTORE_BATCH_BYTES', 9 * 1024 * 1024))
+
+
+# Firestore client for the emulator when FIRESTORE_EMULATOR_HOST is set,
+# otherwise through firebase_admin with the given service account
+def firestore_client(credentials_path):
+    if os.getenv('FIRESTORE_EMULATOR_HOST'):
+        # The client reads FIRESTORE_EMULATOR_HOST itself; no credentials needed
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud import firestore as cloud_firestore
+        return cloud_firestore.Client(project=FIRESTORE_PROJECT, credentials=AnonymousCredentials())
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    firebase_admin.initialize_app(credentials.Certificate(credentials_path))
+    return firestore.client()
+
+
+def _chunks(text, vector):
+    indices = np.asarray(vector['indices'], dtype='<u4')
+    values = np.asarray(vector['values'], dtype='<f4')
+    count = max(1, -(-len(text) // FIRESTORE_CHUNK_CHARS), -(-len(indices) // FIRESTORE_CHUNK_NNZ))
+    for n in range(count):
+        text_slice = slice(n * FIRESTORE_CHUNK_CHARS, (n + 1) * FIRESTORE_CHUNK_CHARS)
+        vector_slice = slice(n * FIRESTORE_CHUNK_NNZ, (n + 1) * FIRESTORE_CHUNK_NNZ)
+        yield {
+            'text': text[text_slice],
+            'indices': indices[vector_slice].tobytes(),
+            'values': values[vector_slice].tobytes(),
+        }
+
+
+# Approximate encoded size of one write: the document path plus its
+# string and bytes fields (other fields are small)
+def _write_size(ref, data):
+    size = len(ref.path) + 32
+    for name, value in data.items():
+        size += len(name)
+        if isinstance(value, str):
+            size += len(value.encode('utf-8'))
+        elif isinstance(value, bytes):
+            size += len(value)
+        else:
+            size += 16
+    return size
+
+
+def _vector(parent, chunks):
+    indices = np.frombuffer(b''.join(chunk['indices'] for chunk in chunks), dtype='<u4')
+    values = np.frombuffer(b''.join(chunk['values'] for chunk in chunks), dtype='<f4')
+    return {'dim': parent['dim'], 'indices': indices.tolist(), 'values': values.tolist()}
+
+
+# documents/{id} is a small parent ({'chunk_count', 'dim', 'nnz', ...}) and
+# the text and vector are split across documents/{id}/chunks/{n}. Chunks are
+# written before their parent and readers trust only its chunk_count.
+class FirestoreStore:
+    def __init__(self, db, collection=FIRESTORE_COLLECTION):
+        self.db = db
+        self.collection = db.collection(collection)
+
+    def _writes(self, doc_id, text, vector, fields):
+        ref = self.collection.document(doc_id)
+        chunks = list(_chunks(text, vector))
+        chunk_writes = [(ref.collection('chunks').document(f'{n:05d}'), chunk) for n, chunk in enumerate(chunks)]
+        parent = dict(fields or {}, chunk_count=len(chunks), dim=vector['dim'],
+                      nnz=len(vector['indices']), text_length=len(text), dtype='float32',
+                      updated=time.time())
+        return chunk_writes, (ref, parent)
+
+    # Chunk documents of doc_id numbered chunk_count or above
+    def _orphan_chunks(self, doc_id, chunk_count):
+        chunks_ref = self.collection.document(doc_id).collection('chunks')
+        return [ref for ref in chunks_ref.list_documents() if int(ref.id) >= chunk_count]
+
+    # Commit a batch, retrying transient errors with exponential backoff;
+    # the writes are plain sets and deletes, so a retry is harmless
+    def _commit(self, batch):
+        from google.api_core import exceptions
+        retryable = (exceptions.Aborted, exceptions.DeadlineExceeded, exceptions.InternalServerError,
+                     exceptions.ResourceExhausted, exceptions.ServiceUnavailable)
+        for attempt in range(FIRESTORE_MAX_ATTEMPTS):
+            try:
+                return batch.commit()
+            except retryable:
+                if attempt == FIRESTORE_MAX_ATTEMPTS - 1:
+                    raise
+                time.sleep(FIRESTORE_BACKOFF_SECONDS * 2 ** attempt)
+
+    # Commit (ref, data) writes in order, data None for a delete, in batches
+    # of up to 500 writes and FIRESTORE_BATCH_BYTES
+    def _commit_writes(self, writes):
+        batch, count, size = self.db.batch(), 0, 0
+        for ref, data in writes:
+            write_size = _write_size(ref, data or {})
+            if count and (count >= FIRESTORE_BATCH_WRITES or size + write_size > FIRESTORE_BATCH_BYTES):
+                self._commit(batch)
+                batch, count, size = self.db.batch(), 0, 0
+            if data is None:
+                batch.delete(ref)
+            else:
+                batch.set(ref, data)
+            count += 1
+            size += write_size
+        if count:
+            self._commit(batch)
+
+    # Store one document with batched writes, the parent in the last commit
+    def put(self, doc_id, text, vector, fields=None):
+        chunk_writes, parent_write = self._writes(doc_id, text, vector, fields)
+        self._commit_writes(chunk_writes + [parent_write])
+        orphans = self._orphan_chunks(doc_id, parent_write[1]['chunk_count'])
+        self._commit_writes([(ref, None) for ref in orphans])
+
+    # Store many documents through a BulkWriter, which sends writes in
+    # parallel with rate limiting and retries failed writes. docs is an
+    # iterable of (doc_id, text, vector, fields).
+    def put_many(self, docs):
+        from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions, SendMode
+        writer = self.db.bulk_writer(options=BulkWriterOptions(
+            max_ops_per_second=FIRESTORE_MAX_OPS_PER_SECOND, mode=SendMode.parallel))
+        failures = []
+
+        def on_error(error, bulk_writer):
+            if error.attempts < FIRESTORE_MAX_ATTEMPTS:
+                return True
+            failures.append(error)
+            return False
+        writer.on_write_error(on_error)
+
+        parents = []
+        for doc_id, text, vector, fields in docs:
+            chunk_writes, parent_write = self._writes(doc_id, text, vector, fields)
+            for ref, data in chunk_writes:
+                writer.set(ref, data)
+            parents.append((doc_id, parent_write))
+        # Parents go out only once all chunks are written, and leftover
+        # chunks are deleted only once their parent is
+        writer.flush()
+        for doc_id, (ref, data) in parents:
+            writer.set(ref, data)
+        writer.flush()
+        for doc_id, (ref, data) in parents:
+            for orphan in self._orphan_chunks(doc_id, data['chunk_count']):
+                writer.delete(orphan)
+        writer.close()
+        if failures:
+            raise RuntimeError(f'{len(failures)} Firestore writes failed: {failures[0].message}')
+
+    # {'text', 'vector', ...parent fields} or None
+    def get(self, doc_id):
+        ref = self.collection.document(doc_id)
+        snapshot = ref.get()
+        if not snapshot.exists:
+            return None
+        return self._assemble(snapshot.to_dict(), ref.collection('chunks'))
+
+    # The given parent fields of doc_id, without reading its chunks; None
+    # when it does not exist
+    def get_fields(self, doc_id, field_paths):
+        snapshot = self.collection.document(doc_id).get(field_paths=field_paths)
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def _assemble(self, parent, chunks_ref):
+        count = parent.get('chunk_count', 0)
+        chunks = [chunk.to_dict() for chunk in chunks_ref.order_by('__name__').limit(count).stream()]
+        return dict(parent, text=''.join(chunk['text'] for chunk in chunks), vector=_vector(parent, chunks))
+
+    # (doc_id, vector) for every complete document, or only those updated
+    # after since. A full load reads all vector chunks in one collection
+    # group query and skips the text.
+    def iter_vectors(self, since=None):
+        query = self.collection if since is None else self.collection.where('updated', '>', since)
+        parents = {snapshot.id: snapshot.to_dict() for snapshot in query.stream()}
+        if since is None:
+            chunks = self.db.collection_group('chunks').select(['indices', 'values']).stream()
+        else:
+            chunks = (
+                chunk for doc_id in parents
+                for chunk in self.collection.document(doc_id).collection('chunks').select(['indices', 'values']).stream()
+            )
+        grouped = {}
+        for chunk in chunks:
+            parent_ref = chunk.reference.parent.parent
+            if parent_ref.parent.id != self.collection.id or parent_ref.id not in parents:
+                continue
+            if int(chunk.id) < parents[parent_ref.id].get('chunk_count', 0):
+                grouped.setdefault(parent_ref.id, []).append((chunk.id, chunk.to_dict()))
+        for doc_id, parent in parents.items():
+            parts = sorted(grouped.get(doc_id, []), key=lambda part: part[0])
+            if parts and len(parts) == parent.get('chunk_count'):
+                yield doc_id, _vector(parent, [chunk for _, chunk in parts])
+
+
+if __name__ == '__main__':
+    if not os.getenv('FIRESTORE_EMULATOR_HOST'):
+        print('Set FIRESTORE_EMULATOR_HOST to the local emulator, e.g. localhost:8080')
+        raise SystemExit(1)
+    store = FirestoreStore(firestore_client(None), collection='firestore_store_check')
+    text = 'x' * (FIRESTORE_CHUNK_CHARS * 2 + 5)
+    vector = {'dim': 2 ** 18, 'indices': list(range(0, 2 ** 18, 3)), 'values': [0.5] * len(range(0, 2 ** 18, 3))}
+    store.put('single', text, vector)
+    store.put_many([(f'bulk_{i}', text, vector, {'filename': f'bulk_{i}.txt'}) for i in range(3)])
+    for doc_id in ['single', 'bulk_0', 'bulk_1', 'bulk_2']:
+        stored = store.get(doc_id)
+        assert stored['text'] == text and stored['vector']['indices'] == vector['indices'], doc_id
+        print(doc_id, stored['chunk_count'], 'chunks ok')
+    # A shorter version leaves no chunks behind
+    store.put('single', 'short', {'dim': 2 ** 18, 'indices': [1], 'values': [1.0]})
+    assert store.get('single')['text'] == 'short'
+    assert not store._orphan_chunks('single', 1)
+    print('single re-put, leftover chunks deleted')
@@ -0,0 +1,118 @@
+# Shared HTTP client for the Groq endpoints used by Rag-app.py
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+GROQ_BASE_URL = os.getenv('GROQ_BASE_URL', 'https://api.groq.com')
+GROQ_CONNECT_TIMEOUT = float(os.getenv('GROQ_CONNECT_TIMEOUT', 5))
+GROQ_READ_TIMEOUT = float(os.getenv('GROQ_READ_TIMEOUT', 60))
+GROQ_MAX_RETRIES = int(os.getenv('GROQ_MAX_RETRIES', 5))
+GROQ_BACKOFF_FACTOR = float(os.getenv('GROQ_BACKOFF_FACTOR', 0.5))
+GROQ_CONCURRENCY = int(os.getenv('GROQ_CONCURRENCY', 4))
+GROQ_BATCH_ITEMS = int(os.getenv('GROQ_BATCH_ITEMS', 64))
+GROQ_BATCH_BYTES = int(os.getenv('GROQ_BATCH_BYTES', 512 * 1024))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+# Split items into lists of at most max_items whose JSON encoding stays
+# under max_bytes (an item bigger than max_bytes goes alone)
+def batches(items, max_items=GROQ_BATCH_ITEMS, max_bytes=GROQ_BATCH_BYTES):
+    batch, size = [], 0
+    for item in items:
+        item_size = len(json.dumps(item))
+        if batch and (len(batch) >= max_items or size + item_size > max_bytes):
+            yield batch
+            batch, size = [], 0
+        batch.append(item)
+        size += item_size
+    if batch:
+        yield batch
+
+
+class GroqClient:
+    def __init__(self, api_key, base_url=GROQ_BASE_URL, concurrency=GROQ_CONCURRENCY, max_retries=GROQ_MAX_RETRIES):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (GROQ_CONNECT_TIMEOUT, GROQ_READ_TIMEOUT)
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f"Bearer {api_key}"
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=GROQ_BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['POST']),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        # One pooled connection per concurrent request
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='groq')
+
+    def _post(self, path, payload, **kwargs):
+        response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def _embed_batch(self, texts):
+        result = self._post('/embedding', {'texts': texts}).json()
+        embeddings = result['embeddings'] if isinstance(result, dict) else result
+        if len(embeddings) != len(texts):
+            raise ValueError(f'Expected {len(texts)} embeddings, got {len(embeddings)}')
+        return embeddings
+
+    # One embedding per text, in order
+    def embed(self, texts):
+        embeddings = []
+        for batch_embeddings in self.pool.map(self._embed_batch, batches(texts)):
+            embeddings.extend(batch_embeddings)
+        return embeddings
+
+    def generate(self, prompt):
+        return self._post('/generate', {'prompt': prompt}).json()['generated_text']
+
+    # Yield the answer token by token. If timings is a dict it is filled
+    # with first_token_seconds, total_seconds and tokens once the stream ends
+    # (first_token_seconds stays None if nothing was generated).
+    def generate_stream(self, prompt, timings=None):
+        timings = {} if timings is None else timings
+        started = time.perf_counter()
+        timings.update(first_token_seconds=None, total_seconds=None, tokens=0)
+        response = self._post('/generate', {'prompt': prompt, 'stream': True},
+                              headers={'Accept': 'text/event-stream'}, stream=True)
+        with response:
+            # chunk_size=None hands over data as it arrives instead of
+            # waiting for a full buffer
+            for line in response.iter_lines(chunk_size=None):
+                line = line.decode('utf-8')
+                if not line.startswith('data:'):
+                    continue  # event names, comments and blank separators
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                event = json.loads(data)
+                if 'error' in event:
+                    raise RuntimeError(f"Generation failed: {event['error']}")
+                # {'token': ...}, or an OpenAI-style chunk
+                token = event.get('token')
+                if token is None and event.get('choices'):
+                    token = event['choices'][0].get('delta', {}).get('content')
+                if not token:
+                    continue
+                if timings['first_token_seconds'] is None:
+                    timings['first_token_seconds'] = time.perf_counter() - started
+                timings['tokens'] += 1
+                yield token
+        timings['total_seconds'] = time.perf_counter() - started
+
+    def push_vectors(self, vectors):
+        for batch in batches(vectors):
+            self._post('/vectors', {'vectors': batch})
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+        self.session.close()
@@ -0,0 +1,161 @@
+# Local stand-in for the Groq endpoints (GROQ_BASE_URL=http://127.0.0.1:8089):
+#   python groq_stub.py [check]
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GROQ_STUB_PORT = int(os.getenv('GROQ_STUB_PORT', 8089))
+GROQ_STUB_FAIL_EVERY = int(os.getenv('GROQ_STUB_FAIL_EVERY', 0))
+GROQ_STUB_TOKEN_DELAY = float(os.getenv('GROQ_STUB_TOKEN_DELAY', 0.05))
+STUB_DIM = 8
+
+stats_lock = threading.Lock()
+stats = {'requests': 0, 'failures': 0, 'texts': 0, 'largest_batch': 0, 'vectors': 0}
+connections = set()
+
+
+def embed(text):
+    digest = hashlib.sha256(text.encode('utf-8')).digest()
+    return [byte / 255.0 for byte in digest[:STUB_DIM]]
+
+
+def embedding(payload):
+    texts = payload['texts']
+    with stats_lock:
+        stats['texts'] += len(texts)
+        stats['largest_batch'] = max(stats['largest_batch'], len(texts))
+    return [embed(text) for text in texts]
+
+
+def answer(prompt):
+    return f'Stub answer to a {len(prompt)}-character prompt.'
+
+
+def generate(payload):
+    return {'generated_text': answer(payload['prompt'])}
+
+
+def vectors(payload):
+    with stats_lock:
+        stats['vectors'] += len(payload['vectors'])
+    return {'stored': len(payload['vectors'])}
+
+
+ROUTES = {'/embedding': embedding, '/generate': generate, '/vectors': vectors}
+
+
+# On http.server rather than Flask: the Werkzeug dev server closes every
+# connection, which would hide whether the client reuses its connections
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep their connections alive
+    protocol_version = 'HTTP/1.1'
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Server-sent events in HTTP/1.1 chunks, one chunk per event
+    def send_events(self, events):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for event in events:
+            data = f'data: {event}\n\n'.encode('utf-8')
+            self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+
+    def stream_answer(self, prompt):
+        words = answer(prompt).split(' ')
+        for n, word in enumerate(words):
+            time.sleep(GROQ_STUB_TOKEN_DELAY)
+            yield json.dumps({'token': word if n == 0 else ' ' + word})
+        yield '[DONE]'
+
+    def do_GET(self):
+        if self.path != '/stats':
+            return self.send_json(404, {'error': 'not found'})
+        with stats_lock:
+            self.send_json(200, dict(stats, connections=len(connections)))
+
+    def do_POST(self):
+        # Always read the body, or the next request on this connection breaks
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        with stats_lock:
+            stats['requests'] += 1
+            connections.add(self.client_address)
+            fail = GROQ_STUB_FAIL_EVERY and stats['requests'] % GROQ_STUB_FAIL_EVERY == 0
+            if fail:
+                stats['failures'] += 1
+                status = 429 if stats['failures'] % 2 else 503
+        if fail:
+            return self.send_json(status, {'error': 'injected failure'}, {'Retry-After': '0'})
+        if self.path == '/generate' and payload.get('stream'):
+            return self.send_events(self.stream_answer(payload['prompt']))
+        route = ROUTES.get(self.path)
+        if route is None:
+            return self.send_json(404, {'error': 'not found'})
+        self.send_json(200, route(payload))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=GROQ_STUB_PORT):
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def check():
+    global GROQ_STUB_FAIL_EVERY
+    from groq_client import GroqClient
+    GROQ_STUB_FAIL_EVERY = 5
+    server = serve(0)
+    client = GroqClient('stub-key', base_url=f'http://127.0.0.1:{server.server_port}')
+    texts = [f'chunk {i} ' + 'x' * (i % 50) for i in range(1000)]
+    embeddings = client.embed(texts)
+    assert embeddings == [embed(text) for text in texts], 'embeddings out of order'
+    client.push_vectors(embeddings)
+    question = 'What is in the document?'
+    print(client.generate(question))
+    timings = {}
+    tokens = []
+    for token in client.generate_stream(question, timings):
+        tokens.append((token, time.perf_counter()))
+    print(timings)
+    assert ''.join(token for token, _ in tokens) == answer(question)
+    # Tokens arrived one by one, not all at once at the end
+    assert timings['first_token_seconds'] < timings['total_seconds'] / 2
+    assert tokens[-1][1] - tokens[0][1] >= GROQ_STUB_TOKEN_DELAY * (len(tokens) - 2)
+    result = client.session.get(f'http://127.0.0.1:{server.server_port}/stats', timeout=5).json()
+    print(result)
+    assert result['texts'] >= len(texts) and result['vectors'] == len(texts)
+    assert result['largest_batch'] <= 64 and result['failures'] > 0
+    assert result['connections'] <= 4, 'connections are not being reused'
+    client.close()
+    server.shutdown()
+    print('ok')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'check':
+        check()
+    else:
+        server = serve()
+        print(f'Groq stub on http://127.0.0.1:{server.server_port}')
+        threading.Event().wait()
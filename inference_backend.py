@@ -0,0 +1,237 @@
+# Selectable CPU inference backend (INFERENCE_BACKEND=torch|onnx) for the models:
+#   python inference_backend.py export|compare
+import json
+import os
+import sys
+import time
+import numpy as np
+from data_dir import data_path
+
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'torch')
+ONNX_MODEL_DIR = os.getenv('ONNX_MODEL_DIR', data_path('onnx_models'))
+ONNX_THREADS = int(os.getenv('ONNX_THREADS', os.cpu_count() or 1))
+BACKENDS = ('torch', 'onnx')
+# SentenceTransformer pooling modes OnnxSentenceEncoder reproduces
+POOLING_MODES = ('cls', 'mean', 'max')
+
+EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+QA_MODEL = 'distilbert-base-cased-distilled-squad'
+QUANTIZED_FILE = 'model_quantized.onnx'
+
+
+def _check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown inference backend: {backend}')
+
+
+def _check_pooling(pooling):
+    if pooling not in POOLING_MODES:
+        raise ValueError(f'Unsupported pooling mode for the onnx backend: {pooling}')
+
+
+def _hub_id(model_name):
+    # SentenceTransformer accepts the short name; the hub needs the org
+    return model_name if '/' in model_name else f'sentence-transformers/{model_name}'
+
+
+def _export_dir(model_name):
+    return os.path.join(ONNX_MODEL_DIR, _hub_id(model_name).replace('/', '__'))
+
+
+# Name for keying caches of embeddings, which differ slightly per backend
+def embedding_cache_name(model_name, backend=INFERENCE_BACKEND):
+    return model_name if backend == 'torch' else f'{model_name}@onnx-int8'
+
+
+def _session_options(threads):
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return options
+
+
+def _quantize(model, tokenizer, out_dir):
+    from optimum.onnxruntime import ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    import tempfile
+    with tempfile.TemporaryDirectory() as exported:
+        model.save_pretrained(exported)
+        quantizer = ORTQuantizer.from_pretrained(exported)
+        # Dynamic quantization: int8 weights, activations quantized at run time
+        config = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        quantizer.quantize(save_dir=out_dir, quantization_config=config)
+    tokenizer.save_pretrained(out_dir)
+
+
+# Export a SentenceTransformer's transformer to quantized ONNX, recording the
+# pooling and normalization the encoder has to reproduce
+def export_embedding_model(model_name):
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from sentence_transformers import SentenceTransformer
+    out_dir = _export_dir(model_name)
+    st_model = SentenceTransformer(model_name)
+    pooling = next(module for module in st_model if type(module).__name__ == 'Pooling')
+    _check_pooling(pooling.get_pooling_mode_str())
+    model = ORTModelForFeatureExtraction.from_pretrained(_hub_id(model_name), export=True)
+    _quantize(model, st_model.tokenizer, out_dir)
+    with open(os.path.join(out_dir, 'encoder_config.json'), 'w') as f:
+        json.dump({
+            'max_seq_length': st_model.max_seq_length,
+            'pooling': pooling.get_pooling_mode_str(),
+            'normalize': any(type(module).__name__ == 'Normalize' for module in st_model),
+        }, f)
+    return out_dir
+
+
+def export_qa_model(model_name):
+    from optimum.onnxruntime import ORTModelForQuestionAnswering
+    from transformers import AutoTokenizer
+    out_dir = _export_dir(model_name)
+    model = ORTModelForQuestionAnswering.from_pretrained(model_name, export=True)
+    _quantize(model, AutoTokenizer.from_pretrained(model_name), out_dir)
+    return out_dir
+
+
+# Quantized ONNX stand-in for the parts of SentenceTransformer used here:
+# encode(), tokenizer and max_seq_length
+class OnnxSentenceEncoder:
+    def __init__(self, model_name, threads=ONNX_THREADS):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+        path = _export_dir(model_name)
+        if not os.path.exists(os.path.join(path, 'encoder_config.json')):
+            export_embedding_model(model_name)
+        with open(os.path.join(path, 'encoder_config.json')) as f:
+            config = json.load(f)
+        self.max_seq_length = config['max_seq_length']
+        self.pooling = config['pooling']
+        _check_pooling(self.pooling)
+        self.normalize = config['normalize']
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            path, file_name=QUANTIZED_FILE, session_options=_session_options(threads))
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.config.hidden_size
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        vectors = []
+        for first in range(0, len(sentences), batch_size):
+            inputs = self.tokenizer(sentences[first:first + batch_size], padding=True, truncation=True,
+                                    max_length=self.max_seq_length, return_tensors='np')
+            hidden = np.asarray(self.model(**inputs).last_hidden_state)
+            mask = inputs['attention_mask'][..., None].astype(hidden.dtype)
+            if self.pooling == 'cls':
+                pooled = hidden[:, 0]
+            elif self.pooling == 'max':
+                pooled = np.where(mask > 0, hidden, -1e9).max(axis=1)
+            elif self.pooling == 'mean':
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            else:
+                raise ValueError(f'Unsupported pooling mode for the onnx backend: {self.pooling}')
+            if self.normalize:
+                pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors.append(pooled.astype(np.float32))
+        vectors = np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        return vectors[0] if single else vectors
+
+
+def load_embedding_model(model_name, backend=INFERENCE_BACKEND):
+    _check_backend(backend)
+    if backend == 'onnx':
+        return OnnxSentenceEncoder(model_name)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def load_qa_pipeline(model_name=QA_MODEL, backend=INFERENCE_BACKEND):
+    _check_backend(backend)
+    from transformers import pipeline
+    if backend == 'torch':
+        return pipeline("question-answering", model=model_name)
+    from optimum.onnxruntime import ORTModelForQuestionAnswering
+    from transformers import AutoTokenizer
+    path = _export_dir(model_name)
+    if not os.path.exists(os.path.join(path, QUANTIZED_FILE)):
+        export_qa_model(model_name)
+    model = ORTModelForQuestionAnswering.from_pretrained(
+        path, file_name=QUANTIZED_FILE, session_options=_session_options(ONNX_THREADS))
+    return pipeline("question-answering", model=model, tokenizer=AutoTokenizer.from_pretrained(path))
+
+
+SAMPLE_TEXTS = [
+    "The invoice INV-2024-0042 was issued on 3 March and is due within thirty days.",
+    "Our software solutions cover project planning, budgeting and timeline tracking.",
+    "Non-functional requirements include availability of 99.9% and response times under 200 ms.",
+    "The database stores customer records, transactions and audit logs in separate schemas.",
+    "Employees can request leave through the HR portal, subject to manager approval.",
+    "The appendix lists supporting documents, glossary terms and contact information.",
+    "Quarterly revenue grew by twelve percent, driven mainly by consulting services.",
+    "Backups are taken nightly and retained for ninety days in encrypted storage.",
+]
+SAMPLE_QUESTIONS = [
+    ("When is the invoice due?", SAMPLE_TEXTS[0]),
+    ("What availability is required?", SAMPLE_TEXTS[2]),
+    ("How long are backups retained?", SAMPLE_TEXTS[7]),
+    ("What drove revenue growth?", SAMPLE_TEXTS[6]),
+    ("Who approves leave requests?", SAMPLE_TEXTS[4]),
+]
+
+
+def _throughput(run, count, repeat):
+    run()  # warm-up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        run()
+    return count * repeat / (time.perf_counter() - started)
+
+
+# Parity and throughput of the onnx backend against torch
+def compare(texts=SAMPLE_TEXTS, questions=SAMPLE_QUESTIONS, repeat=5):
+    torch_model = load_embedding_model(EMBEDDING_MODEL, 'torch')
+    onnx_model = load_embedding_model(EMBEDDING_MODEL, 'onnx')
+    torch_vectors = torch_model.encode(texts, batch_size=32)
+    onnx_vectors = onnx_model.encode(texts, batch_size=32)
+    cosines = np.sum(torch_vectors * onnx_vectors, axis=1) / (
+        np.linalg.norm(torch_vectors, axis=1) * np.linalg.norm(onnx_vectors, axis=1))
+    print(f'embedding cosine: min {cosines.min():.4f} mean {cosines.mean():.4f}')
+    for name, model in (('torch', torch_model), ('onnx', onnx_model)):
+        rate = _throughput(lambda: model.encode(texts, batch_size=32), len(texts), repeat)
+        print(f'embedding {name}: {rate:.1f} texts/s')
+
+    torch_qa = load_qa_pipeline(QA_MODEL, 'torch')
+    onnx_qa = load_qa_pipeline(QA_MODEL, 'onnx')
+    qs = [question for question, _ in questions]
+    contexts = [context for _, context in questions]
+    torch_answers = [result['answer'] for result in torch_qa(question=qs, context=contexts)]
+    onnx_answers = [result['answer'] for result in onnx_qa(question=qs, context=contexts)]
+    agreement = sum(a.strip() == b.strip() for a, b in zip(torch_answers, onnx_answers)) / len(qs)
+    print(f'QA answer agreement: {agreement:.0%}')
+    for a, b in zip(torch_answers, onnx_answers):
+        if a.strip() != b.strip():
+            print(f'  torch {a!r} vs onnx {b!r}')
+    for name, qa in (('torch', torch_qa), ('onnx', onnx_qa)):
+        rate = _throughput(lambda: qa(question=qs, context=contexts), len(qs), repeat)
+        print(f'QA {name}: {rate:.1f} questions/s')
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'export':
+        print(export_embedding_model(EMBEDDING_MODEL))
+        print(export_qa_model(QA_MODEL))
+    elif command == 'compare':
+        texts = SAMPLE_TEXTS
+        if len(sys.argv) > 2:
+            with open(sys.argv[2], encoding='utf-8') as f:
+                texts = [line.strip() for line in f if line.strip()]
+        compare(texts=texts)
+    else:
+        print('usage: python inference_backend.py export | compare [texts.txt]')
+        sys.exit(1)
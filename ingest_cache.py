@@ -0,0 +1,118 @@
+# Persistent cache of extracted text and embeddings, keyed by the upload's SHA-256
+import hashlib
+import os
+import sqlite3
+import threading
+import numpy as np
+from data_dir import data_path
+
+INGEST_CACHE_PATH = os.getenv('INGEST_CACHE_PATH', data_path('ingest_cache.db'))
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+# SHA-256 of a path or a file-like object (rewound afterwards)
+def sha256_of(source):
+    digest = hashlib.sha256()
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    position = source.tell()
+    for block in iter(lambda: source.read(HASH_BLOCK_SIZE), b''):
+        digest.update(block)
+    source.seek(position)
+    return digest.hexdigest()
+
+
+class IngestCache:
+    def __init__(self, namespace, path=INGEST_CACHE_PATH):
+        self.namespace = namespace
+        self.path = path
+        self._connect()
+        # SQLite connections must not be shared with forked children
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._connect)
+        with self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS ingest ('
+                'namespace TEXT, sha256 TEXT, text TEXT, embedding BLOB, rows INTEGER, '
+                'PRIMARY KEY (namespace, sha256))'
+            )
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS ingest_files ('
+                'namespace TEXT, sha256 TEXT, filename TEXT, '
+                'PRIMARY KEY (namespace, sha256, filename))'
+            )
+
+    def _connect(self):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+
+    # Returns {'text', 'embedding', 'filenames'} or None
+    def get(self, sha256):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT text, embedding, rows FROM ingest WHERE namespace = ? AND sha256 = ?',
+                (self.namespace, sha256)
+            ).fetchone()
+            if row is None:
+                return None
+            filenames = [name for (name,) in self.conn.execute(
+                'SELECT filename FROM ingest_files WHERE namespace = ? AND sha256 = ?',
+                (self.namespace, sha256)
+            )]
+        embedding = None
+        if row[1] is not None:
+            embedding = np.frombuffer(row[1], dtype=np.float32)
+            if row[2] is not None:
+                embedding = embedding.reshape(row[2], -1)
+        return {'text': row[0], 'embedding': embedding, 'filenames': filenames}
+
+    def put(self, sha256, filename, text, embedding=None):
+        blob, rows = None, None
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            blob = embedding.tobytes()
+            rows = embedding.shape[0] if embedding.ndim == 2 else None
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO ingest (namespace, sha256, text, embedding, rows) VALUES (?, ?, ?, ?, ?)',
+                (self.namespace, sha256, text, blob, rows)
+            )
+            self.conn.execute(
+                'INSERT OR IGNORE INTO ingest_files (namespace, sha256, filename) VALUES (?, ?, ?)',
+                (self.namespace, sha256, filename)
+            )
+
+    # Remember another filename for content we already have
+    def add_filename(self, sha256, filename):
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR IGNORE INTO ingest_files (namespace, sha256, filename) VALUES (?, ?, ?)',
+                (self.namespace, sha256, filename)
+            )
+
+    # Content hashes recorded under filename
+    def versions(self, filename):
+        with self.lock:
+            return [sha256 for (sha256,) in self.conn.execute(
+                'SELECT sha256 FROM ingest_files WHERE namespace = ? AND filename = ?',
+                (self.namespace, filename)
+            )]
+
+    # Forget filename for this content; once no filename is left the content
+    # itself is forgotten. Returns the filenames that remain.
+    def remove_filename(self, sha256, filename):
+        with self.lock, self.conn:
+            self.conn.execute(
+                'DELETE FROM ingest_files WHERE namespace = ? AND sha256 = ? AND filename = ?',
+                (self.namespace, sha256, filename)
+            )
+            remaining = [name for (name,) in self.conn.execute(
+                'SELECT filename FROM ingest_files WHERE namespace = ? AND sha256 = ?',
+                (self.namespace, sha256)
+            )]
+            if not remaining:
+                self.conn.execute('DELETE FROM ingest WHERE namespace = ? AND sha256 = ?', (self.namespace, sha256))
+        return remaining
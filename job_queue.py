@@ -0,0 +1,178 @@
+# Local persistent job queue for background ingestion (SQLite plus payload files)
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from data_dir import data_path
+
+JOB_QUEUE_PATH = os.getenv('JOB_QUEUE_PATH', data_path('jobs.db'))
+JOB_PAYLOAD_DIR = os.getenv('JOB_PAYLOAD_DIR', data_path('job_payloads'))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+PROGRESS_FLUSH_SECONDS = 1.0
+
+_queues = []
+
+
+# Nothing runs at import or construction: the serving process calls
+# recover() once and then start() (serve.py: recover_all() in the master,
+# start_all() in each worker)
+def recover_all():
+    for job_queue in _queues:
+        job_queue.recover()
+
+
+def start_all():
+    for job_queue in _queues:
+        job_queue.start()
+
+
+class JobQueue:
+    def __init__(self, handler, path=JOB_QUEUE_PATH, payload_dir=JOB_PAYLOAD_DIR, workers=JOB_WORKERS):
+        self.handler = handler
+        self.path = path
+        self.payload_dir = payload_dir
+        self.worker_count = workers
+        self.workers = []
+        os.makedirs(payload_dir, exist_ok=True)
+        self._connect()
+        with self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, filename TEXT, payload_path TEXT, meta TEXT, status TEXT, '
+                'progress TEXT, result TEXT, error TEXT, created REAL, updated REAL)'
+            )
+        _queues.append(self)
+
+    def _connect(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition()
+        self.progress = {}  # live progress of the jobs running in this process
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.pid = os.getpid()
+
+    # Jobs that were running when the last process stopped start over; call
+    # once before any worker starts, as it would requeue jobs running now
+    def recover(self):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+
+    # Start the worker threads (once; later calls do nothing); in a forked
+    # process this also opens the process's own connection, as SQLite
+    # connections can't cross a fork
+    def start(self):
+        if self.pid != os.getpid():
+            self._connect()
+            self.workers = []
+        with self.lock:
+            if self.workers:
+                return
+            self.workers = [
+                threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                for i in range(self.worker_count)
+            ]
+            for worker in self.workers:
+                worker.start()
+
+    # Store the payload and queue a job for it; returns the job id
+    def enqueue(self, filename, stream, meta=None):
+        job_id = uuid.uuid4().hex
+        payload_path = os.path.join(self.payload_dir, job_id)
+        stream.seek(0)
+        with open(payload_path, 'wb') as f:
+            shutil.copyfileobj(stream, f)
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT INTO jobs (id, filename, payload_path, meta, status, progress, created, updated) '
+                "VALUES (?, ?, ?, ?, 'queued', '{}', ?, ?)",
+                (job_id, filename, payload_path, json.dumps(meta or {}), now, now)
+            )
+        with self.wakeup:
+            self.wakeup.notify()
+        return job_id
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT id, filename, status, progress, result, error, created, updated FROM jobs WHERE id = ?',
+                (job_id,)
+            ).fetchone()
+            live = dict(self.progress.get(job_id, {}))
+        if row is None:
+            return None
+        progress = json.loads(row[3] or '{}')
+        progress.update(live)
+        return {
+            'id': row[0],
+            'filename': row[1],
+            'status': row[2],
+            'progress': progress,
+            'result': json.loads(row[4]) if row[4] else None,
+            'error': row[5],
+            'created': row[6],
+            'updated': row[7],
+        }
+
+    # Mark the oldest queued job as running; returns it or None
+    def _claim(self):
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT id, filename, payload_path, meta FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            claimed = self.conn.execute(
+                "UPDATE jobs SET status = 'running', updated = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), row[0])
+            ).rowcount
+            if not claimed:
+                return None
+            self.progress[row[0]] = {}
+        return {'id': row[0], 'filename': row[1], 'payload_path': row[2], 'meta': json.loads(row[3])}
+
+    def _save(self, job_id, **fields):
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        with self.lock, self.conn:
+            self.conn.execute(
+                f'UPDATE jobs SET {columns}, updated = ? WHERE id = ?',
+                (*fields.values(), time.time(), job_id)
+            )
+
+    def _reporter(self, job_id):
+        last_flush = [0.0]
+
+        def report(**fields):
+            with self.lock:
+                self.progress[job_id].update(fields)
+                progress = dict(self.progress[job_id])
+            now = time.monotonic()
+            if now - last_flush[0] >= PROGRESS_FLUSH_SECONDS:
+                last_flush[0] = now
+                self._save(job_id, progress=json.dumps(progress))
+        return report
+
+    def _run(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                with self.wakeup:
+                    self.wakeup.wait(timeout=1.0)
+                continue
+            try:
+                result = self.handler(job, self._reporter(job['id']))
+                status, error = 'done', None
+            except Exception as e:
+                logging.error(f"Job {job['id']} failed: {e}")
+                result, status, error = None, 'failed', str(e)
+            with self.lock:
+                progress = self.progress.pop(job['id'], {})
+            self._save(job['id'], status=status, progress=json.dumps(progress),
+                       result=json.dumps(result) if result is not None else None, error=error)
+            try:
+                os.remove(job['payload_path'])
+            except OSError:
+                pass
@@ -0,0 +1,95 @@
+# Lazily loaded models and other heavy resources, plus a startup report
+import logging
+import threading
+import time
+
+_resources = {}
+
+
+# Loads on first use (or on /warmup) and otherwise stands in for the loaded
+# object, passing attribute access and calls through. Its own names
+# (resource, loaded, status, warm_up) are not passed through.
+class LazyResource:
+    def __init__(self, name, loader, warmup=None):
+        self._name = name
+        self._loader = loader
+        self._warmup = warmup
+        self._lock = threading.Lock()
+        self._value = None
+        self._loaded = False
+        self._load_seconds = None
+        _resources[name] = self
+
+    def resource(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    started = time.perf_counter()
+                    self._value = self._loader()
+                    self._load_seconds = time.perf_counter() - started
+                    self._loaded = True
+                    logging.info(f"Loaded {self._name} in {self._load_seconds:.2f}s")
+        return self._value
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def status(self):
+        return {'loaded': self._loaded, 'load_seconds': self._load_seconds}
+
+    # Load, then run the warm-up call (if any) so first-request costs such
+    # as allocating buffers are paid here too; returns the seconds it took
+    def warm_up(self):
+        started = time.perf_counter()
+        value = self.resource()
+        if self._warmup is not None:
+            self._warmup(value)
+        return time.perf_counter() - started
+
+    def __getattr__(self, name):
+        return getattr(self.resource(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self.resource()(*args, **kwargs)
+
+
+def resource_status():
+    return {name: resource.status() for name, resource in _resources.items()}
+
+
+def all_loaded():
+    return all(resource.loaded for resource in _resources.values())
+
+
+# Load the named resources without running anything on them; a pre-fork
+# server does this in its master so workers share the loaded weights
+def preload(names):
+    for name in names:
+        _resources[name].resource()
+
+
+# Warm up the named resources (all of them by default); returns seconds per name
+def warm_up(names=None):
+    names = list(_resources) if names is None else names
+    unknown = [name for name in names if name not in _resources]
+    if unknown:
+        raise KeyError(f"Unknown resources: {', '.join(unknown)}")
+    return {name: _resources[name].warm_up() for name in names}
+
+
+# Time spent in each phase of startup; create it before the heavy imports
+# and mark() after each phase
+class StartupReport:
+    def __init__(self):
+        self.began = time.perf_counter()
+        self.last = self.began
+        self.phases = {}
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = round(now - self.last, 3)
+        self.last = now
+
+    def as_dict(self):
+        return {'phases': self.phases, 'total_seconds': round(self.last - self.began, 3)}
@@ -0,0 +1,105 @@
+# Production serving on gunicorn (Linux/macOS): python serve.py app|vectors2
+import importlib
+import os
+import socket
+import subprocess
+import sys
+import time
+from data_dir import data_path
+
+SERVE_WORKERS = int(os.getenv('SERVE_WORKERS', 2))
+SERVE_THREADS = int(os.getenv('SERVE_THREADS', 4))
+SERVE_TORCH_THREADS = int(os.getenv('SERVE_TORCH_THREADS', max(1, (os.cpu_count() or 1) // SERVE_WORKERS)))
+SERVE_PIN_CPUS = os.getenv('SERVE_PIN_CPUS', '0') == '1'
+SERVE_TIMEOUT = int(os.getenv('SERVE_TIMEOUT', 120))
+CHROMA_SERVER_PORT = int(os.getenv('CHROMA_PORT', 8000))
+
+SERVICES = {
+    'app': {'port': 5001, 'preload': ['embedding_model', 'qa_pipeline'], 'chroma': True},
+    'vectors2': {'port': 5000, 'preload': ['embedding_model'], 'chroma': False},
+}
+
+
+# Several processes must not open one persistent Chroma store, so the
+# workers share a Chroma server on it
+def start_chroma_server(path, port, timeout=30):
+    process = subprocess.Popen(['chroma', 'run', '--path', path, '--host', '127.0.0.1', '--port', str(port)])
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('Chroma server exited during startup')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'Chroma server did not start on port {port}')
+
+
+def post_fork(server, worker):
+    if SERVE_PIN_CPUS and hasattr(os, 'sched_setaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+        per_worker = max(1, len(cpus) // SERVE_WORKERS)
+        index = (worker.age - 1) % SERVE_WORKERS
+        os.sched_setaffinity(0, cpus[index * per_worker:(index + 1) * per_worker] or cpus)
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(SERVE_TORCH_THREADS)
+    # Background jobs run in the workers, never in the master
+    if 'job_queue' in sys.modules:
+        sys.modules['job_queue'].start_all()
+
+
+def main():
+    from gunicorn.app.base import BaseApplication
+    if len(sys.argv) != 2 or sys.argv[1] not in SERVICES:
+        print(f"usage: python serve.py {'|'.join(SERVICES)}")
+        sys.exit(1)
+    name = sys.argv[1]
+    service = SERVICES[name]
+
+    # Must be set before the service (and torch/onnxruntime) is imported
+    os.environ.setdefault('OMP_NUM_THREADS', str(SERVE_TORCH_THREADS))
+    os.environ.setdefault('ONNX_THREADS', str(SERVE_TORCH_THREADS))
+    # Each worker gets its own PDF and batch extraction pools
+    os.environ.setdefault('PDF_WORKERS', str(SERVE_TORCH_THREADS))
+    os.environ.setdefault('BATCH_WORKERS', str(SERVE_TORCH_THREADS))
+
+    chroma_server = None
+    if service['chroma'] and SERVE_WORKERS > 1 and not os.getenv('CHROMA_HOST'):
+        chroma_server = start_chroma_server(os.getenv('CHROMA_PATH', data_path('chroma')), CHROMA_SERVER_PORT)
+        os.environ['CHROMA_HOST'] = '127.0.0.1'
+
+    module = importlib.import_module(name)
+    # Requeue jobs left running by the previous server once, before any
+    # worker has claimed one; post_fork starts the workers
+    if 'job_queue' in sys.modules:
+        sys.modules['job_queue'].recover_all()
+    # onnxruntime sessions start their thread pools when created, and those
+    # threads don't survive a fork, so ONNX models load in each worker
+    if os.getenv('INFERENCE_BACKEND', 'torch') == 'torch':
+        from lazy_resources import preload
+        preload(service['preload'])
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', os.getenv('SERVE_BIND', f"0.0.0.0:{service['port']}"))
+            self.cfg.set('workers', SERVE_WORKERS)
+            self.cfg.set('threads', SERVE_THREADS)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('timeout', SERVE_TIMEOUT)
+            self.cfg.set('preload_app', True)
+            self.cfg.set('post_fork', post_fork)
+
+        def load(self):
+            return module.app
+
+    try:
+        Server().run()
+    finally:
+        if chroma_server is not None:
+            chroma_server.terminate()
+
+
+if __name__ == '__main__':
+    main()
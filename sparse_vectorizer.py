@@ -0,0 +1,195 @@
+# Corpus-level TF-IDF shared by the sklearn-based upload services
+import atexit
+import hashlib
+import os
+import pickle
+import sys
+import threading
+import time
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+from data_dir import data_path
+
+SPARSE_VECTORIZER_DIR = os.getenv('SPARSE_VECTORIZER_DIR', data_path('sparse_vectorizer'))
+SPARSE_VECTORIZER_MODE = os.getenv('SPARSE_VECTORIZER_MODE', 'hashing')
+SPARSE_N_FEATURES = int(os.getenv('SPARSE_N_FEATURES', 2 ** 18))
+SPARSE_SAVE_SECONDS = float(os.getenv('SPARSE_SAVE_SECONDS', 30))
+
+
+# One vectorizer shared by all documents of a service. 'hashing' counts
+# terms into a fixed dimension and keeps its document frequencies up to
+# date as texts arrive; 'tfidf' is fitted once
+# (python sparse_vectorizer.py fit <name> <files...>) and then only transforms.
+class SparseVectorizer:
+    def __init__(self, name, mode=SPARSE_VECTORIZER_MODE, n_features=SPARSE_N_FEATURES, path=SPARSE_VECTORIZER_DIR):
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        if mode == 'hashing':
+            self.file_path = os.path.join(path, f'{name}.hashing.npz')
+            self.hasher = HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None)
+            self.n_features = n_features
+            self.doc_freq = np.zeros(n_features, dtype=np.int64)
+            self.n_docs = 0
+            self.counted = set()  # content hashes of the texts counted so far
+            self.dirty = False
+            self.saved_at = time.monotonic()
+            if os.path.exists(self.file_path):
+                self._load(np.load(self.file_path), n_features)
+            atexit.register(self.save)
+        elif mode == 'tfidf':
+            self.file_path = os.path.join(path, f'{name}.tfidf.pkl')
+            self.tfidf = None
+            self.n_features = 0
+            if os.path.exists(self.file_path):
+                with open(self.file_path, 'rb') as f:
+                    self.tfidf = pickle.load(f)
+                self.n_features = len(self.tfidf.vocabulary_)
+        else:
+            raise ValueError(f'Unknown vectorizer mode: {mode}')
+
+    # Fit the tfidf mode on a corpus once and persist it
+    def fit(self, texts):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        if self.mode != 'tfidf':
+            raise ValueError('fit is only used in tfidf mode')
+        tfidf = TfidfVectorizer().fit(texts)
+        with self.lock:
+            self.tfidf = tfidf
+            self.n_features = len(tfidf.vocabulary_)
+            self._save(lambda f: pickle.dump(tfidf, f))
+
+    def _load(self, state, n_features):
+        if 'doc_freq' in state:  # older files hold the dense array
+            if state['doc_freq'].shape[0] != n_features:
+                return
+            self.doc_freq = state['doc_freq']
+        else:
+            if int(state['n_features']) != n_features:
+                return
+            self.doc_freq[state['indices']] = state['counts']
+            self.counted = set(state['counted'].tolist())
+        self.n_docs = int(state['n_docs'])
+
+    # Write the hashing-mode document frequencies if they changed
+    def save(self):
+        if self.mode != 'hashing':
+            return
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                indices = np.flatnonzero(self.doc_freq)
+                state = {
+                    'n_features': self.n_features,
+                    'n_docs': self.n_docs,
+                    'indices': indices,
+                    'counts': self.doc_freq[indices],
+                    'counted': np.array(sorted(self.counted), dtype='U32'),
+                }
+                self.dirty = False
+                self.saved_at = time.monotonic()
+            self._save(lambda f: np.savez(f, **state))
+
+    def _save(self, write):
+        tmp_path = f'{self.file_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, self.file_path)
+
+    # Sparse 1 x n_features row of L2-normalized TF-IDF weights. In hashing
+    # mode update=True counts text as a new corpus document first.
+    def transform(self, text, update=True):
+        return self.transform_many([text], update=update)
+
+    # One row per text; the document frequencies are updated once for the
+    # whole batch, leaving out empty texts and texts already counted
+    def transform_many(self, texts, update=True):
+        if self.mode == 'tfidf':
+            if self.tfidf is None:
+                raise RuntimeError('Vectorizer not fitted; run: python sparse_vectorizer.py fit <name> <files...>')
+            return self.tfidf.transform(texts)
+        counts = self.hasher.transform(texts).tocsr()
+        digests = [hashlib.sha256(text.encode('utf-8')).hexdigest()[:32] for text in texts] if update else []
+        save_due = False
+        with self.lock:
+            new_rows = []
+            for i, digest in enumerate(digests):
+                if counts.indptr[i + 1] > counts.indptr[i] and digest not in self.counted:
+                    self.counted.add(digest)
+                    new_rows.append(counts.indices[counts.indptr[i]:counts.indptr[i + 1]])
+            if new_rows:
+                # Each term counts once per document
+                np.add.at(self.doc_freq, np.concatenate(new_rows), 1)
+                self.n_docs += len(new_rows)
+                self.dirty = True
+                save_due = time.monotonic() - self.saved_at >= SPARSE_SAVE_SECONDS
+            # Same smoothed IDF as TfidfVectorizer
+            idf = np.log((1 + self.n_docs) / (1 + self.doc_freq[counts.indices])) + 1
+        counts.data = counts.data * idf
+        if save_due:
+            self.save()
+        return normalize(counts)
+
+
+# 1 x dim sparse row -> JSON/Firestore friendly dict
+def to_sparse_dict(row):
+    row = row.tocsr()
+    return {'dim': row.shape[1], 'indices': row.indices.tolist(), 'values': row.data.tolist()}
+
+
+def from_sparse_dict(vector):
+    indices = np.asarray(vector['indices'], dtype=np.int32)
+    values = np.asarray(vector['values'], dtype=np.float64)
+    return csr_matrix((values, indices, np.array([0, len(indices)])), shape=(1, vector['dim']))
+
+
+# In-memory search over sparse rows by dot product (cosine, since rows are
+# L2-normalized). Rows are stacked into one CSR matrix on the first search
+# after an add, so a query costs one sparse matrix-vector product.
+class SparseIndex:
+    def __init__(self):
+        self.ids = []
+        self.positions = {}
+        self.rows = []
+        self.matrix = None
+        self.lock = threading.Lock()
+
+    # Add a document, or replace it if the id is already indexed
+    def add(self, doc_id, row):
+        with self.lock:
+            position = self.positions.get(doc_id)
+            if position is None:
+                self.positions[doc_id] = len(self.ids)
+                self.ids.append(doc_id)
+                self.rows.append(row.tocsr())
+            else:
+                self.rows[position] = row.tocsr()
+            self.matrix = None
+
+    def search(self, query_row, k=5):
+        with self.lock:
+            if not self.rows:
+                return []
+            if self.matrix is None:
+                self.matrix = vstack(self.rows, format='csr')
+            matrix, ids = self.matrix, list(self.ids)
+        scores = (matrix @ query_row.tocsr().T).toarray().ravel()
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+
+if __name__ == '__main__':
+    from extraction import extract_text
+    if len(sys.argv) < 4 or sys.argv[1] != 'fit':
+        print('usage: python sparse_vectorizer.py fit <name> <files...>')
+        sys.exit(1)
+    corpus = [extract_text(os.path.basename(path), path) or '' for path in sys.argv[3:]]
+    vectorizer = SparseVectorizer(sys.argv[2], mode='tfidf')
+    vectorizer.fit(corpus)
+    print(f'Fitted {vectorizer.n_features} terms on {len(corpus)} documents -> {vectorizer.file_path}')
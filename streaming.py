@@ -0,0 +1,67 @@
+# Streamed responses (ndjson or sse) for the raw extraction endpoints
+import json
+from contextlib import ExitStack
+from flask import Response, request, stream_with_context
+from uploads import open_upload
+
+STREAM_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream',
+}
+
+
+# Streaming mode asked for by the current request, or None: ?stream=ndjson|sse,
+# or an Accept header that names the stream type itself and prefers it to
+# application/json (wildcards such as curl's */* don't count)
+def stream_mode():
+    requested = request.args.get('stream')
+    if requested in STREAM_MIMETYPES:
+        return requested
+    accept = request.accept_mimetypes
+    named = {value: quality for value, quality in accept}
+    json_quality = accept['application/json']  # includes wildcard matches
+    best, best_quality = None, json_quality
+    for mode, mimetype in STREAM_MIMETYPES.items():
+        if named.get(mimetype, 0) > best_quality:
+            best, best_quality = mode, named[mimetype]
+    return best
+
+
+# {'<kind>': n, 'text': block} for each block, numbered from 0
+def numbered(kind, blocks):
+    for n, block in enumerate(blocks):
+        yield {kind: n, 'text': block}
+
+
+def _iter_ndjson(records):
+    try:
+        for record in records:
+            yield json.dumps(record) + '\n'
+    except Exception as e:
+        yield json.dumps({'error': str(e)}) + '\n'
+
+
+def _iter_sse(records):
+    try:
+        for record in records:
+            yield f'event: record\ndata: {json.dumps(record)}\n\n'
+        yield 'event: end\ndata: {}\n\n'
+    except Exception as e:
+        yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+
+def stream_response(records, mode='ndjson'):
+    body = _iter_sse(records) if mode == 'sse' else _iter_ndjson(records)
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}  # no proxy buffering
+    return Response(stream_with_context(body), mimetype=STREAM_MIMETYPES[mode], headers=headers)
+
+
+# Stream the records of extract(upload). The upload is read now, as the
+# request's file may already be closed when the body is sent, and released
+# once the response is done.
+def upload_stream_response(file, extract, mode='ndjson'):
+    stack = ExitStack()
+    upload = stack.enter_context(open_upload(file, copy=True))
+    response = stream_response(extract(upload), mode)
+    response.call_on_close(stack.close)
+    return response
@@ -0,0 +1,51 @@
+# Uploaded files, parsed from the request's own stream
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from io import BytesIO
+from flask import Request
+
+UPLOAD_SPILL_BYTES = int(os.getenv('UPLOAD_SPILL_BYTES', 32 * 1024 * 1024))
+
+
+# Request class for the services (app.request_class = UploadRequest);
+# Werkzeug's own default spills every upload over 500 KB to disk
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= UPLOAD_SPILL_BYTES:
+            return BytesIO()
+        return tempfile.TemporaryFile('rb+')
+
+
+def _size(stream):
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+# Yields a seekable binary file object with the upload's bytes: the
+# request's own stream, rewound. With copy=True (for a response that is
+# still reading after the request is closed) it is a BytesIO, or above
+# spill_bytes a named temporary file removed when done.
+@contextmanager
+def open_upload(file, spill_bytes=UPLOAD_SPILL_BYTES, copy=False):
+    stream = file.stream
+    stream.seek(0)
+    if not copy:
+        yield stream
+        return
+    if _size(stream) <= spill_bytes:
+        yield BytesIO(stream.read())
+        return
+    suffix = os.path.splitext(file.filename or '')[1]
+    spilled = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+    try:
+        shutil.copyfileobj(stream, spilled)
+        spilled.seek(0)
+        yield spilled
+    finally:
+        spilled.close()
+        os.remove(spilled.name)
@@ -1,16 +1,14 @@
 from flask import Flask, request, jsonify
-import pandas as pd
-from PyPDF2 import PdfReader
-import os
-from docx import Document
-from sklearn.feature_extraction.text import TfidfVectorizer
+from extraction import iter_pdf_pages, iter_docx_paragraphs, iter_txt_blocks, iter_excel_blocks
+from uploads import open_upload, UploadRequest
+from sparse_vectorizer import SparseVectorizer, to_sparse_dict
+from vector_format import vector_response
 
 app = Flask(__name__)
-UPLOAD_FOLDER = "D:/Disruptive Ai/New folder"
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.request_class = UploadRequest  # uploads up to UPLOAD_SPILL_BYTES stay in memory
 
-if not os.path.exists(app.config['UPLOAD_FOLDER']):
-    os.makedirs(app.config['UPLOAD_FOLDER'])
+# One corpus-wide vectorizer, so every document gets comparable vectors
+vectorizer = SparseVectorizer('vector_base')
 
 @app.route('/upload/excel', methods=['POST'])
 def upload_excel():
@@ -20,15 +18,10 @@ def upload_excel():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     if file and file.filename.endswith('.xlsx'):
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(file_path)
-        try:
-            df = pd.read_excel(file_path)
-            text = df.to_string()
+        with open_upload(file) as upload:
+            text = ''.join(iter_excel_blocks(upload))
             vector = vectorize_text(text)
-        finally:
-            os.remove(file_path)
-        return jsonify({'vector': vector.tolist()}), 200
+        return vector_response(to_sparse_dict(vector))
     return jsonify({'error': 'Invalid file format'}), 400
 
 @app.route('/upload/pdf', methods=['POST'])
@@ -39,18 +32,11 @@ def upload_pdf():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     if file and file.filename.endswith('.pdf'):
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(file_path)
         text = ''
-        try:
-            with open(file_path, 'rb') as f:
-                reader = PdfReader(f)
-                for page in reader.pages:
-                    text += page.extract_text()
+        with open_upload(file) as upload:
+            text = ''.join(iter_pdf_pages(upload))
             vector = vectorize_text(text)
-        finally:
-            os.remove(file_path)
-        return jsonify({'vector': vector.tolist()}), 200
+        return vector_response(to_sparse_dict(vector))
     return jsonify({'error': 'Invalid file format'}), 400
 
 @app.route('/upload/document', methods=['POST'])
@@ -61,20 +47,14 @@ def upload_document():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     if file and (file.filename.endswith('.txt') or file.filename.endswith('.docx')):
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(file_path)
         text = ''
-        try:
+        with open_upload(file) as upload:
             if file.filename.endswith('.txt'):
-                with open(file_path, 'r') as f:
-                    text = f.read()
+                text = ''.join(iter_txt_blocks(upload))
             elif file.filename.endswith('.docx'):
-                doc = Document(file_path)
-                text = '\n'.join([para.text for para in doc.paragraphs])
+                text = '\n'.join(iter_docx_paragraphs(upload))
             vector = vectorize_text(text)
-        finally:
-            os.remove(file_path)
-        return jsonify({'vector': vector.tolist()}), 200
+        return vector_response(to_sparse_dict(vector))
     return jsonify({'error': 'Invalid file format'}), 400
 
 @app.route('/upload/all', methods=['POST'])
@@ -84,39 +64,27 @@ def upload_all():
     file = request.files['file']
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-    file.save(file_path)
     
     text = ''
-    try:
+    with open_upload(file) as upload:
         if file.filename.endswith('.xlsx'):
-            df = pd.read_excel(file_path)
-            text = df.to_string()
+            text = ''.join(iter_excel_blocks(upload))
         elif file.filename.endswith('.pdf'):
-            with open(file_path, 'rb') as f:
-                reader = PdfReader(f)
-                for page in reader.pages:
-                    text += page.extract_text()
+            text = ''.join(iter_pdf_pages(upload))
         elif file.filename.endswith('.txt'):
-            with open(file_path, 'r') as f:
-                text = f.read()
+            text = ''.join(iter_txt_blocks(upload))
         elif file.filename.endswith('.docx'):
-            doc = Document(file_path)
-            text = '\n'.join([para.text for para in doc.paragraphs])
+            text = '\n'.join(iter_docx_paragraphs(upload))
         if text:
             vector = vectorize_text(text)
         else:
             return jsonify({'error': 'No text found in file'}), 400
-    finally:
-        os.remove(file_path)
     
-    return jsonify({'vector': vector.tolist()}), 200
+    return vector_response(to_sparse_dict(vector))
 
 def vectorize_text(text):
     try:
-        vectorizer = TfidfVectorizer()
-        vectors = vectorizer.fit_transform([text])
-        return vectors.toarray()[0]
+        return vectorizer.transform(text)
     except Exception as e:
         return {'error': str(e)}
 
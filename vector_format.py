@@ -0,0 +1,83 @@
+# Response encodings for the vector upload endpoints
+import base64
+from flask import Response, jsonify, request
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMATS = ['json', 'base64', 'f32', 'f16', 'msgpack']
+MIMETYPES = {
+    'application/json': 'json',
+    'application/octet-stream': 'f32',
+    'application/msgpack': 'msgpack',
+    'application/x-msgpack': 'msgpack',
+}
+
+
+# Format chosen by the current request (?format= or Accept), or None if it
+# can't be served: json (default), base64 (JSON with base64 float32), f32 /
+# f16 (raw bytes; shape in X-Vector-* headers) or msgpack
+def negotiate_format():
+    requested = request.args.get('format')
+    if requested:
+        if requested not in FORMATS or (requested == 'msgpack' and msgpack is None):
+            return None
+        return requested
+    offered = [mimetype for mimetype in MIMETYPES if msgpack is not None or 'msgpack' not in mimetype]
+    best = request.accept_mimetypes.best_match(offered, default='application/json')
+    chosen = MIMETYPES[best]
+    if chosen == 'f32' and request.args.get('dtype') == 'float16':
+        chosen = 'f16'
+    return chosen
+
+
+def _arrays(vector, dtype):
+    if isinstance(vector, dict):
+        return (np.asarray(vector['indices'], dtype='<u4'), np.asarray(vector['values'], dtype=dtype))
+    return (None, np.asarray(vector, dtype=dtype))
+
+
+def _b64(array):
+    return base64.b64encode(array.tobytes()).decode('ascii')
+
+
+# (response, status) for a vector plus any extra JSON fields
+def vector_response(vector, fields=None):
+    fields = fields or {}
+    chosen = negotiate_format()
+    if chosen is None:
+        return jsonify({'error': 'Unsupported vector format', 'formats': FORMATS}), 406
+
+    if chosen == 'json':
+        if isinstance(vector, dict):
+            return jsonify(dict(fields, vector=vector)), 200
+        return jsonify(dict(fields, vector=np.asarray(vector).tolist())), 200
+
+    dtype = '<f2' if chosen == 'f16' else '<f4'
+    indices, values = _arrays(vector, dtype)
+
+    if chosen == 'base64':
+        encoded = {'encoding': 'base64', 'dtype': 'float32', 'values': _b64(values)}
+        if indices is not None:
+            encoded.update(dim=vector['dim'], indices=_b64(indices), index_dtype='uint32')
+        return jsonify(dict(fields, vector=encoded)), 200
+
+    if chosen == 'msgpack':
+        encoded = {'dtype': 'float32', 'values': values.tobytes()}
+        if indices is not None:
+            encoded.update(dim=vector['dim'], indices=indices.tobytes(), index_dtype='uint32')
+        body = msgpack.packb(dict(fields, vector=encoded), use_bin_type=True)
+        return Response(body, mimetype='application/msgpack'), 200
+
+    headers = {'X-Vector-Dtype': 'float16' if chosen == 'f16' else 'float32'}
+    if indices is None:
+        headers['X-Vector-Dim'] = str(values.shape[-1])
+        body = values.tobytes()
+    else:
+        headers['X-Vector-Dim'] = str(vector['dim'])
+        headers['X-Vector-Nnz'] = str(len(indices))
+        body = indices.tobytes() + values.tobytes()
+    return Response(body, mimetype='application/octet-stream', headers=headers), 200
@@ -1,36 +1,22 @@
-from sentence_transformers import SentenceTransformer
-import fitz  
-import pandas as pd
+from inference_backend import load_embedding_model, embedding_cache_name
 import re
-from docx import Document
+from extraction import iter_pdf_pages_parallel, iter_excel_blocks, iter_docx_paragraphs
+from embedding_cache import EmbeddingCache
+from lazy_resources import LazyResource
 
 
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Loaded on first use, so importing this module stays cheap
+model = LazyResource('embedding_model', lambda: load_embedding_model('all-MiniLM-L6-v2'))
+embedding_cache = EmbeddingCache(embedding_cache_name('all-MiniLM-L6-v2'), model.encode)
 
 def extract_text_from_pdf(pdf_path):
-    text = ""
-    for path in pdf_path:
-        doc = fitz.open(path)
-        for page in doc:
-            text += page.get_text()
-        doc.close() 
-    return text
+    return ''.join(page for path in pdf_path for page in iter_pdf_pages_parallel(path, engine='fitz'))
 
 def extract_text_from_excel(excel_path):
-    text = ""
-    for path in excel_path:
-        df = pd.read_excel(path)
-        for column in df.columns:
-            text += ' '.join(df[column].astype(str).tolist())
-    return text
+    return ''.join(block for path in excel_path for block in iter_excel_blocks(path, index=False))
 
 def extract_text_from_doc(doc_path):
-    text = ""
-    for path in doc_path:
-        doc = Document(path)
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-    return text
+    return ''.join(paragraph + "\n" for path in doc_path for paragraph in iter_docx_paragraphs(path))
 
 def preprocess_text(text):
     text = text.lower()
@@ -39,7 +25,7 @@ def preprocess_text(text):
     return text
 
 def embed_text(text):
-    return model.encode(text)
+    return embedding_cache.encode(text)
 
 
 pdf_path = [
@@ -61,19 +47,22 @@ doc_path = [
 ]
 
 
-pdf_text = extract_text_from_pdf(pdf_path)
-excel_text = extract_text_from_excel(excel_path)
-doc_text = extract_text_from_doc(doc_path)
+# Guarded so pool workers that re-import this module (spawn start method)
+# don't run the whole script again.
+if __name__ == '__main__':
+    pdf_text = extract_text_from_pdf(pdf_path)
+    excel_text = extract_text_from_excel(excel_path)
+    doc_text = extract_text_from_doc(doc_path)
 
-pdf_text_preprocessed = preprocess_text(pdf_text)
-excel_text_preprocessed = preprocess_text(excel_text)
-doc_text_preprocessed = preprocess_text(doc_text)
+    pdf_text_preprocessed = preprocess_text(pdf_text)
+    excel_text_preprocessed = preprocess_text(excel_text)
+    doc_text_preprocessed = preprocess_text(doc_text)
 
 
-pdf_vector = embed_text(pdf_text_preprocessed)
-excel_vector = embed_text(excel_text_preprocessed)
-doc_vector = embed_text(doc_text_preprocessed)
+    pdf_vector = embed_text(pdf_text_preprocessed)
+    excel_vector = embed_text(excel_text_preprocessed)
+    doc_vector = embed_text(doc_text_preprocessed)
 
-print(f"PDF Vector: {pdf_vector}")
-print(f"Excel Vector: {excel_vector}")
-print(f"Document Vector: {doc_vector}")
+    print(f"PDF Vector: {pdf_vector}")
+    print(f"Excel Vector: {excel_vector}")
+    print(f"Document Vector: {doc_vector}")
@@ -1,40 +1,53 @@
+# Created before the other imports so the startup report includes them
+from lazy_resources import StartupReport, LazyResource, resource_status, all_loaded, warm_up
+startup = StartupReport()
+
 from flask import Flask, request, jsonify
-import pandas as pd
-from PyPDF2 import PdfReader
-import os
-from docx import Document
+import logging
 import re
-from sentence_transformers import SentenceTransformer
-import fitz  
+from inference_backend import load_embedding_model, embedding_cache_name
+from extraction import iter_pdf_pages_parallel, iter_excel_blocks, iter_docx_paragraphs, iter_txt_blocks
+from uploads import open_upload, UploadRequest
+from ingest_cache import IngestCache, sha256_of
+from embedding_batcher import EmbeddingBatcher
+from embedding_cache import EmbeddingCache
+from vector_format import vector_response
+from streaming import stream_mode, upload_stream_response
+
+startup.mark('imports')
 
 app = Flask(__name__)
-UPLOAD_FOLDER = r'C:\NIC internship work\project\uploads'
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.request_class = UploadRequest  # uploads up to UPLOAD_SPILL_BYTES stay in memory
+logging.basicConfig(level=logging.INFO)
 
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Loaded on first use or on /warmup
+model = LazyResource(
+    'embedding_model',
+    lambda: load_embedding_model('all-MiniLM-L6-v2'),
+    warmup=lambda model: model.encode(['warm up'], batch_size=1)
+)
 
+# All handler threads encode through one micro-batching queue, behind a
+# persistent cache of everything embedded so far
+embedder = EmbeddingBatcher(model)
+embedding_cache = EmbeddingCache(embedding_cache_name('all-MiniLM-L6-v2'), embedder.encode)
 
-def extract_text_from_pdf(pdf_path):
-    text = ""
-    doc = fitz.open(pdf_path)
-    for page in doc:
-        text += page.get_text()
-    doc.close()  
-    return text
+# Content-hash cache of extracted text and embeddings for every upload
+ingest_cache = IngestCache(namespace='vectors2')
 
-def extract_text_from_excel(excel_path):
-    text = ""
-    df = pd.read_excel(excel_path)
-    for column in df.columns:
-        text += ' '.join(df[column].astype(str).tolist())
-    return text
 
-def extract_text_from_doc(doc_path):
-    text = ""
-    doc = Document(doc_path)
-    for paragraph in doc.paragraphs:
-        text += paragraph.text + "\n"
-    return text
+# Text of each format as it is extracted; ''.join() gives the full text
+def iter_pdf_text(pdf_path):
+    return iter_pdf_pages_parallel(pdf_path, engine='fitz')
+
+def iter_excel_text(excel_path):
+    return iter_excel_blocks(excel_path, index=False)
+
+def iter_doc_text(doc_path):
+    return (paragraph + "\n" for paragraph in iter_docx_paragraphs(doc_path))
+
+def iter_txt_text(txt_path):
+    return iter_txt_blocks(txt_path)
 
 def preprocess_text(text):
     text = text.lower()
@@ -43,7 +56,52 @@ def preprocess_text(text):
     return text
 
 def embed_text(text):
-    return model.encode(text)
+    return embedding_cache.encode(text)
+
+# Extract, preprocess and embed an upload; identical bytes seen before
+# (under any filename) are answered from the ingest cache
+def process_upload(file, extract):
+    sha256 = sha256_of(file.stream)
+    cached = ingest_cache.get(sha256)
+    if cached is not None:
+        ingest_cache.add_filename(sha256, file.filename)
+        return cached['text'], cached['embedding']
+    with open_upload(file) as upload:
+        text = extract(upload)
+    preprocessed_text = preprocess_text(text)
+    vector = embed_text(preprocessed_text)
+    ingest_cache.put(sha256, file.filename, text, vector)
+    return text, vector
+
+# Streaming mode: a {kind: n, 'text'} record per page/paragraph/block as it
+# is extracted, then a final {'vector'} record once the text is embedded.
+# The ingest cache only keeps the whole text, so a cache hit is sent as a
+# single {kind: 0, 'text', 'cached': True} record.
+def iter_upload_records(file, upload, iter_text, kind):
+    sha256 = sha256_of(upload)
+    cached = ingest_cache.get(sha256)
+    if cached is not None:
+        ingest_cache.add_filename(sha256, file.filename)
+        yield {kind: 0, 'text': cached['text'], 'cached': True}
+        yield {'vector': cached['embedding'].tolist()}
+        return
+    blocks = []
+    for n, block in enumerate(iter_text(upload)):
+        blocks.append(block)
+        yield {kind: n, 'text': block}
+    text = ''.join(blocks)
+    vector = embed_text(preprocess_text(text))
+    ingest_cache.put(sha256, file.filename, text, vector)
+    yield {'vector': vector.tolist()}
+
+# Streamed records if the client asked for them, otherwise the text and
+# vector in one response
+def upload_response(file, iter_text, kind, field='text'):
+    mode = stream_mode()
+    if mode:
+        return upload_stream_response(file, lambda upload: iter_upload_records(file, upload, iter_text, kind), mode), 200
+    text, vector = process_upload(file, lambda upload: ''.join(iter_text(upload)))
+    return vector_response(vector, {field: text})
 
 
 @app.route('/upload/excel', methods=['POST'])
@@ -54,12 +112,7 @@ def upload_excel():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     if file and file.filename.endswith('.xlsx'):
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(file_path)
-        text = extract_text_from_excel(file_path)
-        preprocessed_text = preprocess_text(text)
-        vector = embed_text(preprocessed_text)
-        return jsonify({'data': text, 'vector': vector.tolist()}), 200
+        return upload_response(file, iter_excel_text, 'block', field='data')
     return jsonify({'error': 'Invalid file format'}), 400
 
 
@@ -71,12 +124,7 @@ def upload_pdf():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     if file and file.filename.endswith('.pdf'):
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(file_path)
-        text = extract_text_from_pdf(file_path)
-        preprocessed_text = preprocess_text(text)
-        vector = embed_text(preprocessed_text)
-        return jsonify({'text': text, 'vector': vector.tolist()}), 200
+        return upload_response(file, iter_pdf_text, 'page')
     return jsonify({'error': 'Invalid file format'}), 400
 
 
@@ -88,15 +136,9 @@ def upload_document():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     if file and (file.filename.endswith('.txt') or file.filename.endswith('.docx')):
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(file_path)
         if file.filename.endswith('.txt'):
-            text = open(file_path).read()
-        elif file.filename.endswith('.docx'):
-            text = extract_text_from_doc(file_path)
-        preprocessed_text = preprocess_text(text)
-        vector = embed_text(preprocessed_text)
-        return jsonify({'text': text, 'vector': vector.tolist()}), 200
+            return upload_response(file, iter_txt_text, 'block')
+        return upload_response(file, iter_doc_text, 'paragraph')
     return jsonify({'error': 'Invalid file format'}), 400
 
 
@@ -107,23 +149,35 @@ def upload_all():
     file = request.files['file']
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-    file.save(file_path)
 
     if file.filename.endswith('.xlsx'):
-        text = extract_text_from_excel(file_path)
+        return upload_response(file, iter_excel_text, 'block')
     elif file.filename.endswith('.pdf'):
-        text = extract_text_from_pdf(file_path)
+        return upload_response(file, iter_pdf_text, 'page')
     elif file.filename.endswith('.txt'):
-        text = open(file_path).read()
+        return upload_response(file, iter_txt_text, 'block')
     elif file.filename.endswith('.docx'):
-        text = extract_text_from_doc(file_path)
+        return upload_response(file, iter_doc_text, 'paragraph')
     else:
         return jsonify({'error': 'Invalid file format'}), 400
 
-    preprocessed_text = preprocess_text(text)
-    vector = embed_text(preprocessed_text)
-    return jsonify({'text': text, 'vector': vector.tolist()}), 200
+# Load and exercise the model so the first real request doesn't pay for it
+@app.route('/warmup', methods=['POST'])
+def warmup():
+    return jsonify({'warmed_up': warm_up(), 'resources': resource_status()}), 200
+
+# Readiness probe: 200 once the model is resident, 503 until then
+@app.route('/ready', methods=['GET'])
+def ready():
+    body = {'ready': all_loaded(), 'resources': resource_status(), 'startup': startup.as_dict()}
+    return jsonify(body), 200 if body['ready'] else 503
+
+@app.route('/embedding/stats', methods=['GET'])
+def embedding_stats():
+    return jsonify(dict(embedder.stats(), cache=embedding_cache.stats())), 200
+
+startup.mark('init')
+logging.info(f"Startup report: {startup.as_dict()}")
 
 if __name__ == '__main__':
     app.run(debug=True)